@@ -1,10 +1,19 @@
 import datetime
+import functools
+import hashlib
+import inspect
 from typing import Optional
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, TypeAdapter, field_validator
 from pydantic_core.core_schema import ValidationInfo
+from starlette.requests import Request
+from starlette.responses import Response
 
-from app.business.data_import import get_min_max_date
+from app.business.data_generation import get_data_generation
+from app.business.dataset_metadata import get_dataset_metadata
+from app.business.response_cache import get_response_cache, ResponseCache
+from app.business.utils import day_bounds
+from app.database import run_db, run_in_thread
 
 
 class DateRange(BaseModel):
@@ -21,9 +30,9 @@ class DateRange(BaseModel):
         if from_date and to_date and from_date > to_date:
             raise ValueError("to_date cannot be smaller than from_date")
 
-        date_range = get_min_max_date()
-        if from_date > date_range["to"].replace(tzinfo=datetime.timezone.utc):
-            raise ValueError(f"from_date cannot be greater than {date_range['to']}")
+        max_date = get_dataset_metadata().to_date
+        if max_date is not None and from_date > max_date.replace(tzinfo=datetime.timezone.utc):
+            raise ValueError(f"from_date cannot be greater than {max_date}")
 
         return from_date
 
@@ -37,9 +46,60 @@ class DateRange(BaseModel):
         if from_date and to_date and from_date > to_date:
             raise ValueError("from_date cannot be greater than to_date")
 
-        date_range = get_min_max_date()
-        if to_date > date_range["to"].replace(tzinfo=datetime.timezone.utc):
-            raise ValueError(f"to_date cannot be greater than {date_range['to']}")
+        max_date = get_dataset_metadata().to_date
+        if max_date is not None and to_date > max_date.replace(tzinfo=datetime.timezone.utc):
+            raise ValueError(f"to_date cannot be greater than {max_date}")
 
         return to_date
 
+
+def cached_endpoint(endpoint):
+    """
+    Cache the serialized result of the endpoint for the current data generation, keyed by path, query parameters
+    and the date range normalized to whole days. Responses carry an ETag, so clients can revalidate with a 304.
+    The endpoint has to take the request (and optionally a date_range) as keyword arguments.
+    """
+    adapter = TypeAdapter(inspect.signature(endpoint).return_annotation)
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        if cache is None:
+            return await endpoint(*args, **kwargs)
+
+        request: Request = kwargs["request"]
+        generation = await run_db(get_data_generation)
+        key = _cache_key(request, kwargs.get("date_range"))
+        headers = {
+            "ETag": f'"{generation}-{hashlib.sha1(key.encode()).hexdigest()[:20]}"',
+            # Clients have to revalidate with the ETag, so nothing stale is served after an import
+            "Cache-Control": "no-cache",
+        }
+        if headers["ETag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        body = await _call_cache(cache, cache.get, generation, key)
+        if body is None:
+            result = await endpoint(*args, **kwargs)
+            body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+            await _call_cache(cache, cache.put, generation, key, body)
+        return Response(body, media_type="application/json", headers=headers)
+
+    return wrapper
+
+
+async def _call_cache(cache: ResponseCache, func, *args):
+    # The shared store is a SQLite file, so it is only used from a worker thread
+    if cache.has_shared_store:
+        return await run_in_thread(func, *args)
+    return func(*args)
+
+
+def _cache_key(request: Request, date_range: Optional[DateRange]) -> str:
+    parameters = sorted(
+        (name, value) for name, value in request.query_params.multi_items() if name not in ("from_date", "to_date")
+    )
+    if date_range is not None:
+        first_day, end_day = day_bounds(date_range.from_date, date_range.to_date)
+        parameters += [("first_day", str(first_day)), ("end_day", str(end_day))]
+    return request.url.path + "?" + "&".join(f"{name}={value}" for name, value in parameters)
@@ -1,10 +1,10 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter
 
-from app.database import session_producer
-from app.models.albums import Album, AlbumPublicWithArtists
+from app.business.catalogue import get_albums
+from app.database import run_db
+from app.models.albums import AlbumPublicWithArtists
 
 router = APIRouter(
     tags=["albums"],
@@ -13,6 +13,6 @@ router = APIRouter(
 
 
 @router.get("", response_model=List[AlbumPublicWithArtists])
-async def get_all_albums(*, session: Session = Depends(session_producer)):
+async def get_all_albums():
     """Retrieve all albums"""
-    return list(session.exec(select(Album)).unique().all())
+    return await run_db(get_albums)
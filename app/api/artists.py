@@ -1,9 +1,9 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter
 
-from app.database import session_producer
+from app.business.catalogue import get_artists
+from app.database import run_db
 from app.models.artists import Artist
 
 router = APIRouter(
@@ -12,6 +12,6 @@ router = APIRouter(
 )
 
 @router.get("", response_model=List[Artist])
-async def get_all_artists(*, session: Session = Depends(session_producer)):
+async def get_all_artists():
     """Retrieve all artists"""
-    return list(session.exec(select(Artist)).unique().all())
+    return await run_db(get_artists)
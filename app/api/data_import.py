@@ -1,8 +1,8 @@
-import os
-
 from fastapi import APIRouter, UploadFile, HTTPException
 
-from app.business.data_import import load_songs_from_csv, get_min_max_date
+from app.business.dataset_metadata import get_dataset_metadata
+from app.business.import_jobs import create_import_job, get_import_jobs, get_import_job, cancel_import_job
+from app.models.imports import ImportJob, DatasetMetadata
 
 router = APIRouter(
     tags=["data"],
@@ -10,31 +10,44 @@ router = APIRouter(
 )
 
 
-@router.post("/import")
-async def import_file(file: UploadFile) -> str:
+@router.post("/import", status_code=202)
+async def import_file(file: UploadFile) -> ImportJob:
     """
-    Import spotify trend data from kaggle file
+    Upload spotify trend data from kaggle file and queue its import as a background job
     (expected dataset: https://www.kaggle.com/datasets/asaniczka/top-spotify-songs-in-73-countries-daily-updated)
     """
     try:
-        contents = file.file.read()
-        with open("/tmp/" + file.filename, 'wb') as f:
-            f.write(contents)
-    except Exception:
+        return await create_import_job(file)
+    except OSError:
         raise HTTPException(status_code=500, detail='Couldn\'t read file')
-    finally:
-        file.file.close()
 
-    from_date, until_date = await load_songs_from_csv("/tmp/" + file.filename)
-    os.remove("/tmp/" + file.filename)
 
-    if from_date is not None and until_date is not None:
-        return f"Successfully imported spotify trend data for {from_date} - {until_date}"
+@router.get("/import/jobs")
+async def get_jobs() -> list[ImportJob]:
+    """Retrieve all import jobs of this instance"""
+    return get_import_jobs()
+
+
+@router.get("/import/jobs/{job_id}")
+async def get_job(job_id: str) -> ImportJob:
+    """Retrieve the status and progress of an import job"""
+    return get_import_job(job_id)
 
-    return "No new data to import found."
+
+@router.delete("/import/jobs/{job_id}")
+async def cancel_job(job_id: str) -> ImportJob:
+    """Cancel a queued or running import job"""
+    return cancel_import_job(job_id)
 
 
 @router.get("/imported-date-range")
 def get_imported_date_range() -> dict:
     """Retrieve the date range in the currently imported spotify trend data"""
-    return get_min_max_date()
+    metadata = get_dataset_metadata()
+    return {"from": metadata.from_date, "to": metadata.to_date}
+
+
+@router.get("/metadata")
+def get_metadata() -> DatasetMetadata:
+    """Retrieve date range, row counts and countries of the currently imported spotify trend data"""
+    return get_dataset_metadata()
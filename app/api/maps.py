@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
-from app.api._utils import DateRange
+from app.api._utils import DateRange, cached_endpoint
 from app.business.maps import get_map_with_features
 from app.business.popularity import calculate_artist_popularity, calculate_track_popularity, calculate_album_popularity
 from app.business.trends import get_most_popular_track_per_country, \
     get_most_popular_album_per_country, get_most_popular_artist_per_country
+from app.database import run_db
+from app.models.countries import GeometryDetail
 from app.models.maps import FeatureCollection
 
 router = APIRouter(
@@ -14,69 +16,99 @@ router = APIRouter(
 
 
 @router.get("/popularity/artist/{artist_id}")
+@cached_endpoint
 async def get_artist_popularity_map(
+    request: Request,
     artist_id: str,
-    date_range: DateRange = Depends()
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with artist popularity"""
-    return await get_map_with_features(
-        await calculate_artist_popularity(artist_id, date_range.from_date, date_range.to_date),
-        feature_key="popularity"
+    return await run_db(
+        get_map_with_features,
+        await run_db(calculate_artist_popularity, artist_id, date_range.from_date, date_range.to_date),
+        feature_key="popularity",
+        detail=detail
     )
 
 
 @router.get("/popularity/track/{track_id}")
+@cached_endpoint
 async def get_track_popularity_map(
+    request: Request,
     track_id: str,
-    date_range: DateRange = Depends()
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with track popularity"""
-    return await get_map_with_features(
-        await calculate_track_popularity(track_id, date_range.from_date, date_range.to_date),
-        feature_key="popularity"
+    return await run_db(
+        get_map_with_features,
+        await run_db(calculate_track_popularity, track_id, date_range.from_date, date_range.to_date),
+        feature_key="popularity",
+        detail=detail
     )
 
 
 @router.get("/popularity/album/{album_id}")
+@cached_endpoint
 async def get_album_popularity_map(
+    request: Request,
     album_id: str,
-    date_range: DateRange = Depends()
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with album popularity"""
-    return await get_map_with_features(
-        await calculate_album_popularity(album_id, date_range.from_date, date_range.to_date),
-        feature_key="popularity"
+    return await run_db(
+        get_map_with_features,
+        await run_db(calculate_album_popularity, album_id, date_range.from_date, date_range.to_date),
+        feature_key="popularity",
+        detail=detail
     )
 
 
 @router.get("/trends/artist")
+@cached_endpoint
 async def get_artist_trend_map(
-    date_range: DateRange = Depends()
+    request: Request,
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with artist trends"""
-    return await get_map_with_features(
-        get_most_popular_artist_per_country(date_range.from_date, date_range.to_date),
-        feature_key="artist"
+    return await run_db(
+        get_map_with_features,
+        await run_db(get_most_popular_artist_per_country, date_range.from_date, date_range.to_date),
+        feature_key="artist",
+        detail=detail
     )
 
 
 @router.get("/trends/track")
+@cached_endpoint
 async def get_track_trend_map(
-    date_range: DateRange = Depends()
+    request: Request,
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with track trends"""
-    return await get_map_with_features(
-        get_most_popular_track_per_country(date_range.from_date, date_range.to_date),
-        feature_key="track"
+    return await run_db(
+        get_map_with_features,
+        await run_db(get_most_popular_track_per_country, date_range.from_date, date_range.to_date),
+        feature_key="track",
+        detail=detail
     )
 
 
 @router.get("/trends/album")
+@cached_endpoint
 async def get_album_trend_map(
-    date_range: DateRange = Depends()
+    request: Request,
+    date_range: DateRange = Depends(),
+    detail: GeometryDetail = GeometryDetail.MEDIUM
 ) -> FeatureCollection:
     """Geo geojson with album trends"""
-    return await get_map_with_features(
-        get_most_popular_album_per_country(date_range.from_date, date_range.to_date),
-        feature_key="album"
+    return await run_db(
+        get_map_with_features,
+        await run_db(get_most_popular_album_per_country, date_range.from_date, date_range.to_date),
+        feature_key="album",
+        detail=detail
     )
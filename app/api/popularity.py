@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
-from app.api._utils import DateRange
+from app.api._utils import DateRange, cached_endpoint
 from app.business.popularity import calculate_track_popularity, calculate_album_popularity, calculate_artist_popularity
+from app.database import run_db
 
 router = APIRouter(
     tags=["popularity"],
@@ -10,28 +11,34 @@ router = APIRouter(
 
 
 @router.get("/album/{album_id}")
+@cached_endpoint
 async def get_album_popularity(
+    request: Request,
     album_id: str,
     date_range: DateRange = Depends()
 ) -> dict[str, float]:
     """Calculate the popularity of a specific album across the world in a specific range"""
-    return await calculate_album_popularity(album_id, date_range.from_date, date_range.to_date)
+    return await run_db(calculate_album_popularity, album_id, date_range.from_date, date_range.to_date)
 
 
 @router.get("/artist/{artist_id}")
+@cached_endpoint
 async def get_artist_popularity(
+    request: Request,
     artist_id: str,
     date_range: DateRange = Depends()
 ) -> dict[str, float]:
     """Calculate the popularity of a specific artist across the world in a specific range"""
-    return await calculate_artist_popularity(artist_id, date_range.from_date, date_range.to_date)
+    return await run_db(calculate_artist_popularity, artist_id, date_range.from_date, date_range.to_date)
 
 
 @router.get("/track/{track_id}")
+@cached_endpoint
 async def get_track_popularity(
+    request: Request,
     track_id: str,
     date_range: DateRange = Depends()
 ) -> dict[str, float]:
     """Calculate the popularity of a specific track across the world in a specific range"""
-    return await calculate_track_popularity(track_id, date_range.from_date, date_range.to_date)
+    return await run_db(calculate_track_popularity, track_id, date_range.from_date, date_range.to_date)
 
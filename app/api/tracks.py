@@ -1,10 +1,10 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter
 
-from app.database import session_producer
-from app.models.tracks import Track, TrackPublicWithAlbumAndArtists
+from app.business.catalogue import get_tracks
+from app.database import run_db
+from app.models.tracks import TrackPublicWithAlbumAndArtists
 
 router = APIRouter(
     tags=["tracks"],
@@ -13,6 +13,6 @@ router = APIRouter(
 
 
 @router.get("", response_model=List[TrackPublicWithAlbumAndArtists])
-async def get_all_tracks(*, session: Session = Depends(session_producer)):
+async def get_all_tracks():
     """Retrieve all tracks"""
-    return list(session.exec(select(Track)).unique().all())
+    return await run_db(get_tracks)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 
-from app.api._utils import DateRange
+from app.api._utils import DateRange, cached_endpoint
 from app.business.trends import get_most_popular_artist_for_country, \
     get_most_popular_track_for_country, get_most_popular_album_for_country, get_most_popular_album_per_country, \
-    get_most_popular_track_per_country, get_most_popular_artist_per_country
+    get_most_popular_track_per_country, get_most_popular_artist_per_country, get_top_tracks_per_country, \
+    get_top_albums_per_country, get_top_artists_per_country, get_top_tracks_for_country, get_top_albums_for_country, \
+    get_top_artists_for_country
+from app.database import run_db
 from app.models.albums import AlbumPublicWithArtists
 from app.models.artists import Artist
 from app.models.tracks import TrackPublicWithAlbumAndArtists
@@ -15,52 +18,132 @@ router = APIRouter(
 
 
 @router.get("/album")
+@cached_endpoint
 async def get_most_popular_album(
+    request: Request,
     date_range: DateRange = Depends()
 ) -> dict[str, AlbumPublicWithArtists]:
     """Retrieve the most popular album in all available countries in a specific time range"""
-    return get_most_popular_album_per_country(date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_album_per_country, date_range.from_date, date_range.to_date)
 
 
 @router.get("/album/{country_code}")
+@cached_endpoint
 async def get_most_popular_album_in_country(
+    request: Request,
     country_code: str,
     date_range: DateRange = Depends()
 ) -> AlbumPublicWithArtists:
     """Retrieve the most popular album in a specific country in a specific time range"""
-    return get_most_popular_album_for_country(country_code, date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_album_for_country, country_code, date_range.from_date, date_range.to_date)
 
 
 @router.get("/artist")
+@cached_endpoint
 async def get_most_popular_artist(
+    request: Request,
     date_range: DateRange = Depends()
 ) -> dict[str, Artist]:
     """Retrieve the most popular artist in all available countries in a specific time range"""
-    return get_most_popular_artist_per_country(date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_artist_per_country, date_range.from_date, date_range.to_date)
 
 
 @router.get("/artist/{country_code}")
+@cached_endpoint
 async def get_most_popular_artist_in_country(
+    request: Request,
     country_code: str,
     date_range: DateRange = Depends()
 ) -> Artist:
     """Retrieve the most popular artist in a specific country in a specific time range"""
-    return get_most_popular_artist_for_country(country_code, date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_artist_for_country, country_code, date_range.from_date, date_range.to_date)
 
 
 @router.get("/track")
+@cached_endpoint
 async def get_most_popular_track(
+    request: Request,
     date_range: DateRange = Depends()
 ) -> dict[str, TrackPublicWithAlbumAndArtists]:
     """Retrieve the most popular track in all available countries in a specific time range"""
-    return get_most_popular_track_per_country(date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_track_per_country, date_range.from_date, date_range.to_date)
 
 
 @router.get("/track/{country_code}")
+@cached_endpoint
 async def get_most_popular_track_in_country(
+    request: Request,
     country_code: str,
     date_range: DateRange = Depends()
 ) -> TrackPublicWithAlbumAndArtists:
     """Retrieve the most popular track in a specific country in a specific time range"""
-    return get_most_popular_track_for_country(country_code, date_range.from_date, date_range.to_date)
+    return await run_db(get_most_popular_track_for_country, country_code, date_range.from_date, date_range.to_date)
 
+
+@router.get("/top/album")
+@cached_endpoint
+async def get_top_albums(
+    request: Request,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> dict[str, list[AlbumPublicWithArtists]]:
+    """Retrieve the top N albums in all available countries in a specific time range"""
+    return await run_db(get_top_albums_per_country, top_n, date_range.from_date, date_range.to_date)
+
+
+@router.get("/top/album/{country_code}")
+@cached_endpoint
+async def get_top_albums_in_country(
+    request: Request,
+    country_code: str,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> list[AlbumPublicWithArtists]:
+    """Retrieve the top N albums in a specific country in a specific time range"""
+    return await run_db(get_top_albums_for_country, country_code, top_n, date_range.from_date, date_range.to_date)
+
+
+@router.get("/top/artist")
+@cached_endpoint
+async def get_top_artists(
+    request: Request,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> dict[str, list[Artist]]:
+    """Retrieve the top N artists in all available countries in a specific time range"""
+    return await run_db(get_top_artists_per_country, top_n, date_range.from_date, date_range.to_date)
+
+
+@router.get("/top/artist/{country_code}")
+@cached_endpoint
+async def get_top_artists_in_country(
+    request: Request,
+    country_code: str,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> list[Artist]:
+    """Retrieve the top N artists in a specific country in a specific time range"""
+    return await run_db(get_top_artists_for_country, country_code, top_n, date_range.from_date, date_range.to_date)
+
+
+@router.get("/top/track")
+@cached_endpoint
+async def get_top_tracks(
+    request: Request,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> dict[str, list[TrackPublicWithAlbumAndArtists]]:
+    """Retrieve the top N tracks in all available countries in a specific time range"""
+    return await run_db(get_top_tracks_per_country, top_n, date_range.from_date, date_range.to_date)
+
+
+@router.get("/top/track/{country_code}")
+@cached_endpoint
+async def get_top_tracks_in_country(
+    request: Request,
+    country_code: str,
+    top_n: int = Query(default=10, ge=1, le=50),
+    date_range: DateRange = Depends()
+) -> list[TrackPublicWithAlbumAndArtists]:
+    """Retrieve the top N tracks in a specific country in a specific time range"""
+    return await run_db(get_top_tracks_for_country, country_code, top_n, date_range.from_date, date_range.to_date)
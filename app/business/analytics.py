@@ -0,0 +1,377 @@
+import datetime
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, select
+
+from app.business.data_generation import get_data_generation
+from app.business.score_cubes import ScoreCube
+from app.business.utils import day_bounds
+from app.database import engine
+from app.models.configuration import configuration
+from app.models.imports import ImportCheckpoint, CheckpointStage
+from app.models.links import TrackArtistLink
+from app.models.tracks import Track
+from app.models.trends import TrendEntry, RollupEntity
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_analytics: Optional["TrendAnalytics"] = None
+_analytics_lock = threading.Lock()
+_loading = False
+
+
+class TrendAnalytics:
+    """
+    Immutable in-memory copy of the trend entries of one data generation as compact NumPy columns
+    (day ordinal, country index, rank, track index) plus the track -> album and track -> artist mappings.
+    Range scores are read from a prefix-sum cube per track, album and artist.
+    Answers the same questions as the SQL queries in app.business.trends and app.business.popularity,
+    including their tie-breaks (score descending, then entity ID in C collation).
+    """
+
+    def __init__(
+        self,
+        generation: int,
+        checkpoints: dict[tuple[int, datetime.datetime], int],
+        countries: list[str],
+        entity_ids: dict[RollupEntity, list[str]],
+        day: np.ndarray,
+        country: np.ndarray,
+        rank: np.ndarray,
+        track: np.ndarray,
+        track_album: np.ndarray,
+        artist_offsets: np.ndarray,
+        artist_links: np.ndarray,
+        cubes: Optional[dict[RollupEntity, ScoreCube]] = None,
+        cube_start: int = 0,
+    ):
+        """The cubes are built from the entries, or the given cubes are extended by the entries from cube_start on"""
+        self.generation = generation
+        self.checkpoints = checkpoints
+        self.countries = countries
+        self.entity_ids = entity_ids
+        self.day = day
+        self.country = country
+        self.rank = rank
+        self.track = track
+        self.track_album = track_album
+        self.artist_offsets = artist_offsets
+        self.artist_links = artist_links
+
+        self.days = set(np.flatnonzero(np.bincount(day)).tolist()) if len(day) > 0 else set()
+        self._country_index = {code: i for i, code in enumerate(countries)}
+        self._entity_index = {
+            entity_type: {entity_id: i for i, entity_id in enumerate(ids)} for entity_type, ids in entity_ids.items()
+        }
+        # Python string order is code point order, which equals the byte order of the C collation
+        self._country_order = _sort_ranks(countries)
+        self._entity_order = {entity_type: _sort_ranks(ids) for entity_type, ids in entity_ids.items()}
+        cubes = cubes or {entity_type: ScoreCube.empty() for entity_type in RollupEntity}
+        self.cubes = {
+            entity_type: cubes[entity_type].extended(*self._rows(entity_type, cube_start))
+            for entity_type in RollupEntity
+        }
+
+    @classmethod
+    def load(cls, generation: int, previous: Optional["TrendAnalytics"] = None) -> "TrendAnalytics":
+        """
+        Load all trend entries and the current catalogue as columns.
+        Trend entries are only written together with a checkpoint of the import journal. If the checkpoints added
+        since the previous engine was loaded only cover days it does not contain yet and the albums and artists of
+        its tracks are unchanged, only the entries of these days are read and appended to the previous engine.
+        """
+        with Session(engine) as session:
+            # All queries read the same snapshot
+            session.connection(execution_options=dict(isolation_level="REPEATABLE READ"))
+            checkpoints = {
+                (run_id, snapshot_date): row_count for run_id, snapshot_date, row_count in session.exec(
+                    select(ImportCheckpoint.run_id, ImportCheckpoint.snapshot_date, ImportCheckpoint.row_count)
+                    .where(ImportCheckpoint.stage == CheckpointStage.TRENDS)
+                ).all()
+            }
+            tracks = _read_query(session, f"SELECT id, album_id FROM {Track.__tablename__}", dtype=str)
+            links = _read_query(
+                session, f"SELECT track_id, artist_id FROM {TrackArtistLink.__tablename__}", dtype=str
+            )
+
+            new_dates = None
+            if previous is not None:
+                catalogue = _Catalogue(tracks, links, previous)
+                new_dates = _new_dates(previous, checkpoints, catalogue)
+            if new_dates is None:
+                previous = None
+                catalogue = _Catalogue(tracks, links)
+
+            query = f"SELECT date, country_code, rank, track_id FROM {TrendEntry.__tablename__}"
+            if new_dates is not None:
+                dates = ", ".join(f"'{date.isoformat(sep=' ')}'" for date in new_dates)
+                query += f" WHERE date = ANY(ARRAY[{dates}]::timestamp[])"
+            entries = _read_query(
+                session,
+                query,
+                dtype=dict(country_code="category", rank="uint8", track_id="category"),
+                parse_dates=["date"],
+            )
+
+        # Categories are mapped once instead of looking up every row
+        country_codes, countries = _codes(
+            entries["country_code"].cat.categories, [] if previous is None else previous.countries
+        )
+        track_index = pd.Index(catalogue.entity_ids[RollupEntity.TRACK])
+        columns = dict(
+            day=_day_ordinals(entries["date"]),
+            country=country_codes[entries["country_code"].cat.codes].astype(np.int16),
+            rank=entries["rank"].to_numpy(),
+            track=track_index.get_indexer(entries["track_id"].cat.categories)[entries["track_id"].cat.codes]
+            .astype(np.int32),
+        )
+        if previous is not None:
+            columns = {name: np.concatenate([getattr(previous, name), values]) for name, values in columns.items()}
+
+        return cls(
+            generation=generation,
+            checkpoints=checkpoints,
+            countries=countries,
+            entity_ids=catalogue.entity_ids,
+            **columns,
+            track_album=catalogue.track_album,
+            artist_offsets=catalogue.artist_offsets,
+            artist_links=catalogue.artist_links,
+            cubes=None if previous is None else previous.cubes,
+            cube_start=0 if previous is None else len(previous.day),
+        )
+
+    def top_per_country(
+        self,
+        entity_type: RollupEntity,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+    ) -> dict[str, list[str]]:
+        countries, entities, scores = self._scores(entity_type, from_date, to_date)
+        order = np.lexsort((self._entity_order[entity_type][entities], -scores, self._country_order[countries]))
+        countries, entities = countries[order], entities[order]
+
+        # Position of every row within its country
+        is_first = np.ones(len(countries), dtype=bool)
+        is_first[1:] = countries[1:] != countries[:-1]
+        first_rows = np.flatnonzero(is_first)
+        positions = np.arange(len(countries)) - first_rows[np.cumsum(is_first) - 1]
+
+        keep = positions < top_n
+        top = {}
+        for country, entity in zip(countries[keep].tolist(), entities[keep].tolist()):
+            top.setdefault(self.countries[country], []).append(self.entity_ids[entity_type][entity])
+        return top
+
+    def top_for_country(
+        self,
+        entity_type: RollupEntity,
+        country_code: str,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+    ) -> list[str]:
+        if country_code not in self._country_index:
+            return []
+
+        _, entities, scores = self._scores(
+            entity_type, from_date, to_date, country=self._country_index[country_code]
+        )
+        order = np.lexsort((self._entity_order[entity_type][entities], -scores))[:top_n]
+        return [self.entity_ids[entity_type][entity] for entity in entities[order].tolist()]
+
+    def popularity(
+        self,
+        entity_type: RollupEntity,
+        entity_id: str,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+    ) -> dict[str, float]:
+        if entity_id not in self._entity_index[entity_type]:
+            return {}
+
+        countries, _, scores = self._scores(
+            entity_type, from_date, to_date, entity=self._entity_index[entity_type][entity_id]
+        )
+        if len(scores) == 0:
+            return {}
+        return {
+            self.countries[country]: score
+            for country, score in zip(countries.tolist(), (scores / scores.max()).tolist())
+        }
+
+    def _scores(
+        self,
+        entity_type: RollupEntity,
+        from_date: Optional[datetime.datetime],
+        to_date: Optional[datetime.datetime],
+        country: Optional[int] = None,
+        entity: Optional[int] = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Summed score (51 - rank) per country and entity as (countries, entities, scores) arrays"""
+        first_day, end_day = day_bounds(from_date, to_date)
+        return self.cubes[entity_type].range_scores(
+            None if first_day is None else (first_day - _EPOCH).days,
+            None if end_day is None else (end_day - _EPOCH).days,
+            country=country,
+            entity=entity,
+        )
+
+    def _rows(
+        self, entity_type: RollupEntity, start: int = 0
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Scores of the trend entries from start on per entity of the grain as (countries, entities, days, scores) arrays
+        """
+        countries = self.country[start:]
+        days = self.day[start:]
+        tracks = self.track[start:]
+        scores = 51 - self.rank[start:].astype(np.int64)
+
+        if entity_type == RollupEntity.TRACK:
+            return countries, tracks, days, scores
+        if entity_type == RollupEntity.ALBUM:
+            return countries, self.track_album[tracks], days, scores
+
+        # One row per artist of the track
+        starts = self.artist_offsets[tracks]
+        counts = self.artist_offsets[tracks + 1] - starts
+        expanded = np.repeat(np.arange(len(tracks)), counts)
+        within = np.arange(len(expanded)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return countries[expanded], self.artist_links[starts[expanded] + within], days[expanded], scores[expanded]
+
+
+class _Catalogue:
+    """
+    Track -> album and track -> artist mappings as codes. The tracks, albums and artists of the previous engine
+    keep their codes, new ones are appended.
+    """
+
+    def __init__(self, tracks: pd.DataFrame, links: pd.DataFrame, previous: Optional[TrendAnalytics] = None):
+        known = previous.entity_ids if previous is not None else {entity_type: [] for entity_type in RollupEntity}
+        track_codes, track_ids = _codes(tracks["id"], known[RollupEntity.TRACK])
+        album_codes, album_ids = _codes(tracks["album_id"], known[RollupEntity.ALBUM])
+        artist_codes, artist_ids = _codes(links["artist_id"], known[RollupEntity.ARTIST])
+        self.entity_ids = {
+            RollupEntity.TRACK: track_ids,
+            RollupEntity.ALBUM: album_ids,
+            RollupEntity.ARTIST: artist_ids,
+        }
+
+        # Tracks of the previous engine that no longer exist have no album
+        self.track_album = np.full(len(track_ids), -1, np.int32)
+        self.track_album[track_codes] = album_codes
+
+        # Artists of each track as compressed rows: artist_links[artist_offsets[t]:artist_offsets[t + 1]]
+        link_tracks = pd.Index(track_ids).get_indexer(links["track_id"])
+        order = np.lexsort((artist_codes, link_tracks))
+        self.artist_offsets = np.zeros(len(track_ids) + 1, np.int64)
+        np.cumsum(np.bincount(link_tracks, minlength=len(track_ids)), out=self.artist_offsets[1:])
+        self.artist_links = artist_codes[order].astype(np.int32)
+
+
+def get_trend_analytics() -> Optional[TrendAnalytics]:
+    """
+    The in-memory engine if it is enabled and loaded for the current data generation, otherwise queries are
+    answered by the database. A stale engine is reloaded in the background.
+    """
+    global _loading
+    if not configuration.analytics.in_memory:
+        return None
+
+    analytics = _analytics
+    if analytics is not None and analytics.generation == get_data_generation():
+        return analytics
+
+    with _analytics_lock:
+        if _loading:
+            return None
+        _loading = True
+    threading.Thread(target=load_trend_analytics, name="trend-analytics", daemon=True).start()
+    return None
+
+
+def load_trend_analytics():
+    """Load the trend entries into memory (if enabled), unless the current data generation is already loaded"""
+    global _analytics, _loading
+    if not configuration.analytics.in_memory:
+        return
+
+    try:
+        # Read before the entries, so changes during loading lead to another reload
+        generation = get_data_generation()
+        if _analytics is not None and _analytics.generation == generation:
+            return
+
+        print("Loading trend entries into memory...")
+        _analytics = TrendAnalytics.load(generation, _analytics)
+        print(f"Loaded {len(_analytics.day)} trend entries of data generation {generation} into memory.")
+    finally:
+        with _analytics_lock:
+            _loading = False
+
+
+def _new_dates(
+    previous: TrendAnalytics, checkpoints: dict[tuple[int, datetime.datetime], int], catalogue: _Catalogue
+) -> Optional[list[datetime.datetime]]:
+    """
+    Days imported since the previous engine was loaded, None if it cannot be extended with them
+    (checkpoints have been removed, a day it contains has been changed or the mappings of its tracks changed)
+    """
+    if not previous.checkpoints.keys() <= checkpoints.keys():
+        return None
+
+    tracks = len(previous.track_album)
+    links = previous.artist_offsets[-1]
+    if not (
+        np.array_equal(previous.track_album, catalogue.track_album[:tracks])
+        and np.array_equal(previous.artist_offsets, catalogue.artist_offsets[:tracks + 1])
+        and np.array_equal(previous.artist_links, catalogue.artist_links[:links])
+    ):
+        return None
+
+    new_dates = sorted({
+        snapshot_date for (run_id, snapshot_date), row_count in checkpoints.items()
+        if (run_id, snapshot_date) not in previous.checkpoints and row_count > 0
+    })
+    if any(day in previous.days for day in _day_ordinals(pd.Series(new_dates, dtype="datetime64[ns]")).tolist()):
+        return None
+    return new_dates
+
+
+def _codes(values: pd.Series | pd.Index, known: list[str]) -> tuple[np.ndarray, list[str]]:
+    """Codes of the values, the known values keep their position and new values are appended"""
+    index = pd.Index(known, dtype=object)
+    uniques = pd.Index(pd.unique(values), dtype=object)
+    index = index.append(uniques[~uniques.isin(index)])
+    return index.get_indexer(values), list(index)
+
+
+def _day_ordinals(dates: pd.Series) -> np.ndarray:
+    days = (dates.to_numpy().astype("datetime64[D]") - np.datetime64(_EPOCH.date())).astype(np.int64)
+    if len(days) > 0 and (days.min() < 0 or days.max() > np.iinfo(np.uint16).max):
+        raise ValueError("Snapshot dates have to be between 1970-01-01 and 2149-06-06.")
+    return days.astype(np.uint16)
+
+
+def _read_query(session: Session, query: str, **kwargs) -> pd.DataFrame:
+    """Read the result of the query with COPY into a dataframe, which is much faster than fetching row tuples"""
+    cursor = session.connection().connection.cursor()
+    with tempfile.TemporaryFile() as file:
+        try:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+        finally:
+            cursor.close()
+        file.seek(0)
+        return pd.read_csv(file, **kwargs)
+
+
+def _sort_ranks(values: list[str]) -> np.ndarray:
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[sorted(range(len(values)), key=values.__getitem__)] = np.arange(len(values))
+    return ranks
@@ -0,0 +1,154 @@
+import io
+
+import pandas as pd
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session
+
+from app.business.import_registry import ImportRegistry
+from app.database import ensure_trend_partitions
+from app.models.albums import Album, AlbumType
+from app.models.artists import Artist
+from app.models.links import AlbumArtistLink, TrackArtistLink
+from app.models.tracks import Track
+
+# CSV column -> trend_entries column, in the order they are written to the staging table
+_TREND_COLUMNS = {
+    "snapshot_date": "date",
+    "country": "country_code",
+    "daily_rank": "rank",
+    "daily_movement": "daily_movement",
+    "weekly_movement": "weekly_movement",
+    "popularity": "popularity_at_date",
+    "spotify_id": "track_id",
+}
+
+
+def copy_trend_entries(df: pd.DataFrame, session: Session) -> int:
+    """
+    Stream the trend rows of the dataframe into a staging table using COPY and merge them into trend_entries.
+    Missing partitions of trend_entries are created in the same transaction.
+    Rows of unknown tracks are skipped, for duplicate (date, country, rank) keys only the first row is kept.
+    Returns the number of inserted rows.
+    """
+    if len(df) == 0:
+        return 0
+
+    buffer = io.StringIO()
+    df[list(_TREND_COLUMNS.keys())].to_csv(buffer, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    buffer.seek(0)
+
+    columns = ", ".join(_TREND_COLUMNS.values())
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS trend_entries_staging ("
+            " ordinal BIGSERIAL,"
+            " date TIMESTAMP NOT NULL,"
+            " country_code VARCHAR NOT NULL,"
+            " rank INTEGER NOT NULL,"
+            " daily_movement INTEGER NOT NULL,"
+            " weekly_movement INTEGER NOT NULL,"
+            " popularity_at_date INTEGER NOT NULL,"
+            " track_id VARCHAR NOT NULL"
+            ") ON COMMIT DROP"
+        )
+        # The staging table still exists if rows have already been copied in the same transaction
+        cursor.execute("TRUNCATE trend_entries_staging")
+        cursor.copy_expert(
+            f"COPY trend_entries_staging ({columns}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute("SELECT min(date), max(date) FROM trend_entries_staging")
+        from_date, to_date = cursor.fetchone()
+        ensure_trend_partitions(from_date, to_date, session.connection())
+        cursor.execute(
+            f"INSERT INTO trend_entries ({columns}) "
+            f"SELECT DISTINCT ON (s.date, s.country_code, s.rank) "
+            f"{', '.join('s.' + c for c in _TREND_COLUMNS.values())} "
+            f"FROM trend_entries_staging s JOIN tracks t ON t.id = s.track_id "
+            f"ORDER BY s.date, s.country_code, s.rank, s.ordinal "
+            f"ON CONFLICT DO NOTHING"
+        )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def write_entities(
+    artists: list[dict],
+    albums: list[dict],
+    tracks: list[dict],
+    audio_features: dict[str, dict],
+    session: Session,
+    registry: ImportRegistry,
+):
+    """
+    Insert the resolved Spotify artists, albums and tracks including their artist links with one
+    multi-row statement per table, in dependency order. Already existing rows are skipped.
+    """
+    artist_rows = [
+        dict(
+            id=artist["id"],
+            name=artist["name"],
+            image_url=_image_url(artist),
+            spotify_url=artist["external_urls"]["spotify"],
+            genres=artist.get("genres", []),
+        )
+        for artist in artists
+    ]
+    _insert_ignore(Artist, artist_rows, session)
+    registry.artist_ids.update(row["id"] for row in artist_rows)
+
+    album_rows = [
+        dict(
+            id=album["id"],
+            name=album["name"],
+            total_tracks=album["total_tracks"],
+            album_type=AlbumType(album["album_type"]),
+            image_url=_image_url(album),
+            spotify_url=album["external_urls"]["spotify"],
+        )
+        for album in albums
+    ]
+    _insert_ignore(Album, album_rows, session)
+    _insert_ignore(AlbumArtistLink, _artist_links("album_id", albums, registry), session)
+    registry.album_ids.update(row["id"] for row in album_rows)
+
+    # Tracks without audio features cannot be stored
+    tracks = [track for track in tracks if audio_features.get(track["id"]) is not None]
+    track_rows = [
+        dict(
+            id=track["id"],
+            name=track["name"],
+            preview_url=track.get("preview_url"),
+            spotify_url=track["external_urls"]["spotify"],
+            explicit=track["explicit"],
+            album_id=track["album"]["id"],
+            **{
+                field: audio_features[track["id"]][field] for field in Track.model_fields.keys()
+                if field in audio_features[track["id"]] and field != "id"
+            },
+        )
+        for track in tracks
+    ]
+    _insert_ignore(Track, track_rows, session)
+    _insert_ignore(TrackArtistLink, _artist_links("track_id", tracks, registry), session)
+    registry.track_ids.update(row["id"] for row in track_rows)
+
+
+def _artist_links(key: str, entities: list[dict], registry: ImportRegistry) -> list[dict]:
+    return list({
+        (entity["id"], artist["id"]): {key: entity["id"], "artist_id": artist["id"]}
+        for entity in entities for artist in entity["artists"]
+        if artist["id"] in registry.artist_ids
+    }.values())
+
+
+def _insert_ignore(model, rows: list[dict], session: Session):
+    if len(rows) == 0:
+        return
+    session.execute(insert(model.__table__).on_conflict_do_nothing(), rows)
+
+
+def _image_url(entity: dict):
+    return entity["images"][0]["url"] if len(entity.get("images", [])) > 0 else None
@@ -0,0 +1,27 @@
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models.albums import Album, AlbumPublicWithArtists
+from app.models.artists import Artist
+from app.models.tracks import Track, TrackPublicWithAlbumAndArtists
+
+
+def get_albums() -> list[AlbumPublicWithArtists]:
+    with Session(engine) as session:
+        albums = session.exec(select(Album).options(selectinload(Album.artists))).all()
+        return [AlbumPublicWithArtists.model_validate(album) for album in albums]
+
+
+def get_artists() -> list[Artist]:
+    with Session(engine) as session:
+        # Validated from the column values, so the relationships of the table model are not loaded
+        return [Artist.model_validate(artist.model_dump()) for artist in session.exec(select(Artist)).all()]
+
+
+def get_tracks() -> list[TrackPublicWithAlbumAndArtists]:
+    with Session(engine) as session:
+        tracks = session.exec(
+            select(Track).options(joinedload(Track.album).lazyload(Album.artists), selectinload(Track.artists))
+        ).all()
+        return [TrackPublicWithAlbumAndArtists.model_validate(track) for track in tracks]
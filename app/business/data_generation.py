@@ -0,0 +1,48 @@
+import datetime
+import threading
+import time
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models.configuration import configuration
+from app.models.imports import DataGeneration
+
+_NAME = "trends"
+
+_lock = threading.Lock()
+_generation = 0
+_checked_at = 0.0
+
+
+def get_data_generation() -> int:
+    """Current generation of the imported data, re-read from the database at most every few seconds"""
+    global _generation, _checked_at
+    if time.monotonic() - _checked_at < configuration.response_cache.generation_check_seconds:
+        return _generation
+
+    with Session(engine) as session:
+        generation = session.exec(select(DataGeneration.generation).where(DataGeneration.name == _NAME)).first()
+    with _lock:
+        _generation, _checked_at = generation or 0, time.monotonic()
+    return _generation
+
+
+def bump_data_generation() -> int:
+    """Mark the imported data as changed, which invalidates all cached results"""
+    global _generation, _checked_at
+    statement = insert(DataGeneration.__table__).values(
+        name=_NAME, generation=1, updated_at=datetime.datetime.now()
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[DataGeneration.name],
+        set_=dict(generation=DataGeneration.generation + 1, updated_at=statement.excluded.updated_at),
+    ).returning(DataGeneration.generation)
+
+    with Session(engine) as session:
+        generation = session.execute(statement).scalar_one()
+        session.commit()
+    with _lock:
+        _generation, _checked_at = generation, time.monotonic()
+    return generation
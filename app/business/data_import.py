@@ -1,303 +1,231 @@
-import asyncio
 import datetime
+import hashlib
 import json
-import logging
-import re
-import time
-from typing import Callable, Awaitable
+import os
+from typing import Iterator, Optional, TextIO
 
 import kagglehub
 import pandas as pd
-import requests
+from pandas.api.types import union_categoricals
+from geoalchemy2 import functions as geo_func
 from geoalchemy2.shape import from_shape
-from playwright.async_api import async_playwright
 from shapely.geometry import shape
-from sqlalchemy import func
+from sqlalchemy import func, literal, delete
+from sqlalchemy.dialects.postgresql import insert
 
 from sqlmodel import Session, select
 
-from app.database import engine
-from app.models.albums import Album
-from app.models.artists import Artist
-from app.models.countries import Country
-from app.models.tracks import Track
+from app.business.analytics import load_trend_analytics
+from app.business.data_generation import bump_data_generation
+from app.business.dataset_metadata import refresh_dataset_metadata
+from app.business.import_journal import ImportJournal
+from app.business.import_manifest import plan_csv_import, open_csv_range, record_csv_import, CsvImportPlan
+from app.business.import_pipeline import run_import_pipeline
+from app.business.import_registry import ImportRegistry
+from app.database import engine, advisory_lock, run_in_thread
+from app.models.configuration import configuration
+from app.models.countries import Country, CountryGeometry, GeometryDetail
+from app.models.imports import ImportProgress, ImportStage, ImportRunStatus, DatasetVersion, CheckpointStage
 from app.models.trends import TrendEntry
 
+_COUNTRIES_PATH = 'static/world-administrative-boundaries.geojson'
+
+# Key of the advisory lock that serializes the imports of all processes
+_IMPORT_LOCK_KEY = 7_301_946
+
+# Tolerances (in degrees) of the simplified country geometries
+_SIMPLIFICATION_TOLERANCES = {
+    GeometryDetail.HIGH: 0.01,
+    GeometryDetail.MEDIUM: 0.05,
+    GeometryDetail.LOW: 0.1,
+}
+
+_CSV_DTYPES = {
+    "spotify_id": "category",
+    "country": "category",
+    "daily_rank": "uint8",
+    "daily_movement": "int8",
+    "weekly_movement": "int8",
+    "popularity": "uint8",
+}
+
 
 async def import_songs_from_kaggle():
     path = kagglehub.dataset_download("asaniczka/top-spotify-songs-in-73-countries-daily-updated")
     await load_songs_from_csv(path + '/universal_top_spotify_songs.csv')
 
 
-def get_min_max_date():
-    with Session(engine) as session:
-        from_date = session.exec(select(func.min(TrendEntry.date))).first()
-        to_date = session.exec(select(func.max(TrendEntry.date))).first()
-        return {"from": from_date, "to": to_date}
+async def load_songs_from_csv(path: str, progress: Optional[ImportProgress] = None, source: Optional[str] = None):
+    """
+    Import the trend entries of the CSV file that are not yet imported. The manifest and journal of the file
+    are kept under the source name (the file name by default). Only one import runs at a time.
+    """
+    progress = progress or ImportProgress()
+    async with advisory_lock(_IMPORT_LOCK_KEY):
+        return await _load_songs_from_csv(path, progress, source or os.path.basename(path))
 
 
-async def load_songs_from_csv(path: str):
-    df = pd.read_csv(
-        path,
-        parse_dates=['snapshot_date', 'album_release_date']
-    )
-    # Drop global entries (country is part of the primary key and must be given!)
-    df.dropna(subset=['country'], inplace=True)
+async def _load_songs_from_csv(path: str, progress: ImportProgress, source: str):
+    progress.set_stage(ImportStage.PARSING)
 
-    # Delta-load
-    max_date = get_min_max_date().get("to", None)
-    if max_date is not None:
-        df = df.loc[(df['snapshot_date'] > max_date)]
+    # Only parse the part of the file that is not yet part of the import manifest
+    plan = await run_in_thread(plan_csv_import, path, source)
+    if plan.is_empty:
+        progress.set_stage(ImportStage.FINISHED)
+        print("File has already been imported. Skipping import...")
+        return None, None
 
-    if len(df) == 0:
+    progress.set_stage(ImportStage.IMPORTING)
+    registry = await run_in_thread(_load_registry)
+    journal = await run_in_thread(ImportJournal.start, plan.file_name)
+
+    # Delta-load, the file is parsed while the days are imported
+    days = _read_songs_csv_range(path, plan, await run_in_thread(_get_delta_start, journal))
+    status = ImportRunStatus.FAILED
+    try:
+        dates = await run_import_pipeline(days, registry, progress, journal)
+        status = ImportRunStatus.SUCCEEDED
+    finally:
+        await run_in_thread(days.close)
+        await run_in_thread(journal.finish, status)
+        # Days committed before a failure or cancellation invalidate the cached results as well
+        if journal.has_changes:
+            await run_in_thread(refresh_dataset_metadata, await run_in_thread(bump_data_generation))
+
+    await run_in_thread(record_csv_import, path, plan)
+    if len(dates) == 0:
+        progress.set_stage(ImportStage.FINISHED)
         print("No new data found. Skipping import...")
         return None, None
 
-    date = df["snapshot_date"].min()
-    while date <= df["snapshot_date"].max():
-        next_date = date + datetime.timedelta(days=1)
-        temp_df = df.loc[(df['snapshot_date'] < next_date)]
-        temp_df = temp_df.loc[(temp_df['snapshot_date'] >= date)]
-        print(f"Loading trends for {date} ({len(temp_df)} entries)...")
-        await load_dataframe(temp_df)
-        date = next_date
-
+    await run_in_thread(load_trend_analytics)
+    progress.set_stage(ImportStage.FINISHED)
     print("Finished.")
-    return df["snapshot_date"].min(), df["snapshot_date"].max()
-
+    return min(dates), max(dates)
 
-async def load_dataframe(df: pd.DataFrame):
-    if len(df) == 0:
-        return
 
+def _get_delta_start(journal: ImportJournal) -> Optional[datetime.datetime]:
+    """
+    Newest day imported before the run, only the rows of later days are imported.
+    Days are written in the order of the file, so the days already written by a resumed run are not taken into
+    account. They are skipped by the journal instead.
+    """
     with Session(engine) as session:
-        await ensure_tracks_exist(df["spotify_id"].unique(), session)
-
-        existing_track_ids: list[str] = list(session.exec(select(Track.id).distinct()).all())
-        keys = set()
-
-        for row in df.to_dict('records'):
-            track_id = row["spotify_id"]
-            key = (row["snapshot_date"], row["country"], row["daily_rank"])
-            if track_id in existing_track_ids and key not in keys:
-                session.add(
-                    TrendEntry(
-                        track_id=track_id,
-                        date=row["snapshot_date"],
-                        popularity_at_date=row["popularity"],
-                        country_code=row["country"],
-                        rank=row["daily_rank"],
-                        **row
-                    )
-                )
-                keys.add(key)
-
-        session.commit()
-
-
-async def get_access_token() -> str:
-    # Copied from: https://www.kaggle.com/code/asaniczka/top-spotify-playlist-extractor/notebook
-    url = "https://open.spotify.com/playlist/37i9dQZEVXbNG2KDcFcKOF"
-
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True)
-        page = await browser.new_page()
-
-        async with page.expect_request(
-                re.compile("pathfinder/v1/query")
-        ) as request_info:
-            await page.goto(url)
-
-        res = await request_info.value
-        auth_token = await res.header_value("authorization")
-        return auth_token.replace("Bearer", "").strip()
-
-
-async def ensure_tracks_exist(track_ids: list[str], session: Session):
-    access_token = await get_access_token()
-
-    existing_track_ids: list[str] = list(session.exec(select(Track.id).distinct()).all())
-    new_track_ids = [track_id for track_id in track_ids if track_id not in existing_track_ids]
-    if len(new_track_ids) == 0:
-        return
-
-    resolved_new_tracks = await batch_spotify_request(
-        new_track_ids, get_tracks_from_spotify, 100, access_token
-    )
-
-    resolved_audio_features = {feat["id"]: feat for feat in await batch_spotify_request(
-        new_track_ids, get_audio_features_from_spotify, 100, access_token
-    )}
-
-    existing_album_ids: list[str] = list(session.exec(select(Album.id).distinct()).all())
-    new_albums = list(
-        {t["album"]["id"]: t["album"] for t in resolved_new_tracks if t["album"]["id"] not in existing_album_ids}
-        .values()
-    )
-
-    existing_artist_ids: list[str] = list(session.exec(select(Artist.id).distinct()).all())
-    new_artists_album_ids = {artist['id'] for album in new_albums for artist in album["artists"] if
-                             artist['id'] not in existing_artist_ids}
-    resolved_album_artists = await batch_spotify_request(
-        list(new_artists_album_ids), get_artists_from_spotify, 10, access_token
-    )
-
-    add_artists_to_session(resolved_album_artists, session)
-    add_albums_to_session(new_albums, session)
-
-    new_track_artists_ids = {
-        artist['id'] for t in resolved_new_tracks for artist in t["artists"]
-        if artist["id"] not in existing_artist_ids and artist["id"] not in new_artists_album_ids
-    }
-    resolved_track_artists = await batch_spotify_request(
-        list(new_track_artists_ids), get_artists_from_spotify, 10, access_token
-    )
-
-    add_artists_to_session(resolved_track_artists, session)
-    add_tracks_to_session(resolved_new_tracks, resolved_audio_features, session)
-
-
-def add_tracks_to_session(tracks: list[dict], audio_features_dict: dict, session: Session):
-    for track in tracks:
-        artists = track.pop('artists', [])
-        album = track.pop('album', {})
-
-        audio_features = audio_features_dict.get(track["id"])
-        del audio_features["id"]
-        del audio_features["type"]
-        del audio_features["uri"]
-        del track["duration_ms"]
-
-        session.add(
-            Track(
-                album_id=album["id"],
-                spotify_url=track["external_urls"]["spotify"],
-                artists=[session.get(Artist, artist["id"]) for artist in artists],
-                **track,
-                **audio_features
-            )
-        )
+        statement = select(func.max(TrendEntry.date))
+        written_dates = journal.dates(CheckpointStage.TRENDS)
+        if len(written_dates) > 0:
+            statement = statement.where(TrendEntry.date.notin_(written_dates))
+        return session.exec(statement).one()
 
 
-def add_artists_to_session(artists: list[dict], session: Session):
-    for artist in artists:
-        session.add(
-            Artist(
-                image_url=artist["images"][0]["url"] if len(artist["images"]) > 0 else None,
-                spotify_url=artist["external_urls"]["spotify"],
-                **artist
-            )
-        )
+def _read_songs_csv_range(
+    path: str, plan: CsvImportPlan, min_date: Optional[datetime.datetime]
+) -> Iterator[tuple[datetime.datetime, pd.DataFrame]]:
+    with open_csv_range(path, plan) as source:
+        yield from read_songs_csv_days(source, min_date)
 
 
-def add_albums_to_session(albums: list[dict], session: Session):
-    for album in albums:
-        artists = album.pop('artists', [])
-        session.add(
-            Album(
-                image_url=album["images"][0]["url"] if len(album["images"]) > 0 else None,
-                spotify_url=album["external_urls"]["spotify"],
-                artists=[session.get(Artist, artist["id"]) for artist in artists],
-                **album
-            )
+def _load_registry() -> ImportRegistry:
+    with Session(engine) as session:
+        return ImportRegistry.load(session)
+
+
+def read_songs_csv_days(
+    source: str | TextIO, min_date: Optional[datetime.datetime] = None
+) -> Iterator[tuple[datetime.datetime, pd.DataFrame]]:
+    """
+    Read the trend rows newer than min_date chunk by chunk, parsing only the columns used by the import,
+    and yield them per snapshot day in the order of the file as soon as a day is complete.
+    Only the rows of the pending days are kept in memory, stored with categorical and small integer dtypes.
+    The rows of a day are expected to be stored contiguously, otherwise the day is yielded once per block of rows.
+    """
+    pending: list[pd.DataFrame] = []
+    pending_date = None
+    with pd.read_csv(
+        source,
+        usecols=[*_CSV_DTYPES.keys(), "snapshot_date"],
+        dtype=_CSV_DTYPES,
+        parse_dates=["snapshot_date"],
+        chunksize=configuration.data_import.csv_chunk_size,
+    ) as reader:
+        for chunk in reader:
+            # Drop global entries (country is part of the primary key and must be given!)
+            chunk = chunk.dropna(subset=["country"])
+            if min_date is not None:
+                chunk = chunk.loc[chunk["snapshot_date"] > min_date]
+
+            # The last day of a chunk may be continued by the next chunk
+            for date, day_df in chunk.groupby(chunk["snapshot_date"].dt.normalize(), sort=False):
+                if len(pending) > 0 and date != pending_date:
+                    yield pending_date, _concat_chunks(pending)
+                    pending = []
+                pending.append(day_df)
+                pending_date = date
+
+    if len(pending) > 0:
+        yield pending_date, _concat_chunks(pending)
+
+
+def _concat_chunks(chunks: list[pd.DataFrame]) -> pd.DataFrame:
+    if len(chunks) == 1:
+        return chunks[0]
+
+    return pd.DataFrame({
+        column: (
+            union_categoricals([chunk[column] for chunk in chunks]).remove_unused_categories()
+            if isinstance(chunks[0][column].dtype, pd.CategoricalDtype)
+            else pd.concat([chunk[column] for chunk in chunks], ignore_index=True)
         )
+        for column in chunks[0].columns
+    })
 
 
-async def batch_spotify_request(
-    ids: list[str], func: Callable[[list[str], str], Awaitable[list[dict]]], batch_size: int, access_token: str
-):
-    futures = []
-    for i in range(0, len(ids), batch_size):
-        futures.append(func(list(ids)[i:i + batch_size], access_token))
-
-    return [
-        r for response in (await asyncio.gather(*futures))
-        for r in response if r is not None
-    ]
-
-
-async def get_tracks_from_spotify(track_ids: list[str], access_token: str) -> list[dict]:
-    return (await make_spotify_request(
-        "GET",
-        "tracks",
-        {"ids": ",".join(track_ids)},
-        access_token=access_token
-    )).get("tracks", [])
-
-
-async def get_artists_from_spotify(artist_ids: list[str], access_token: str) -> list[dict]:
-    return (await make_spotify_request(
-        "GET",
-        "artists",
-        {"ids": ",".join(artist_ids)},
-        access_token=access_token
-    )).get("artists", [])
-
-
-async def get_audio_features_from_spotify(track_ids: list[str], access_token: str) -> list[dict]:
-    return (await make_spotify_request(
-        "GET",
-        "audio-features",
-        {"ids": ",".join(track_ids)},
-        access_token=access_token
-    )).get("audio_features", [])
-
-
-async def make_spotify_request(method, path, params, access_token) -> dict | list[dict]:
-    headers = {"Authorization": f"Bearer {access_token}"}
-    retries = 0
-    while retries < 5:
-        response = requests.request(
-            method,
-            "https://api.spotify.com/v1/" + path,
-            headers=headers,
-            params=params
-        )
-        try:
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            print(
-                f"Got an error attempting {method} on {path}: "
-                f"{response.text} [{response.status_code}]"
-            )
+def import_countries():
+    with open(_COUNTRIES_PATH, 'rb') as file:
+        content = file.read()
+    checksum = hashlib.sha256(content).hexdigest()
 
-            if response.status_code == 401:
-                # Refresh the access token
-                access_token = await get_access_token()
-                headers = {"Authorization": f"Bearer {access_token}"}
+    with Session(engine) as session:
+        version = session.get(DatasetVersion, "countries")
+        if version is not None and version.checksum == checksum:
+            print("Already imported country data.")
+            return
 
-            retries += 1
-            time.sleep(10 * retries)
-            logging.info(f"Retrying...")
-    else:
-        raise Exception(f"Failed {method} on {path}")
+        print("Importing country data...")
+        countries = {}
+        for feature in json.loads(content)['features']:
+            alpha_2_code = feature['properties']['iso_3166_1_alpha_2_codes']
+            if alpha_2_code and alpha_2_code not in countries:
+                countries[alpha_2_code] = dict(
+                    alpha_2_code=alpha_2_code,
+                    name=feature['properties']['name'],
+                    polygon=from_shape(shape(feature['geometry'])),
+                )
 
+        statement = insert(Country.__table__)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Country.alpha_2_code],
+                set_=dict(name=statement.excluded.name, polygon=statement.excluded.polygon),
+            ),
+            list(countries.values())
+        )
 
-def import_countries():
-    with Session(engine) as session:
-        print("Importing country data...")
-        imported_countries = []
-        with open('static/world-administrative-boundaries.geojson') as file:
-            gj = json.load(file)
-            for feature in gj['features']:
-                alpha_2_code = feature['properties']['iso_3166_1_alpha_2_codes']
-                if not alpha_2_code or session.get(Country, alpha_2_code) is not None:
-                    continue
-
-                name = feature['properties']['name']
-                print(alpha_2_code, end='...')
-                imported_countries.append(alpha_2_code)
-                session.add(
-                    Country(
-                        alpha_2_code=alpha_2_code,
-                        name=name,
-                        polygon=from_shape(
-                            shape(feature['geometry'])
-                        )
+        # Pre-simplified geometries for the map endpoints
+        session.execute(delete(CountryGeometry))
+        for detail, tolerance in _SIMPLIFICATION_TOLERANCES.items():
+            session.execute(
+                insert(CountryGeometry.__table__).from_select(
+                    ["alpha_2_code", "detail", "polygon"],
+                    select(
+                        Country.alpha_2_code,
+                        literal(detail, CountryGeometry.__table__.c.detail.type),
+                        geo_func.ST_Multi(geo_func.ST_SimplifyPreserveTopology(Country.polygon, tolerance)),
                     )
                 )
+            )
+
+        session.merge(DatasetVersion(name="countries", checksum=checksum, imported_at=datetime.datetime.now()))
         session.commit()
-        if len(imported_countries) > 0:
-            print(f"\nFinished importing {len(imported_countries)} countries...")
-        print("Already imported country data.")
+        bump_data_generation()
+        print(f"Finished importing {len(countries)} countries...")
@@ -0,0 +1,70 @@
+import threading
+from typing import Optional
+
+from sqlalchemy import func, select, distinct
+
+from app.business.data_generation import get_data_generation
+from app.database import engine
+from app.models.albums import Album
+from app.models.artists import Artist
+from app.models.imports import DatasetMetadata
+from app.models.tracks import Track
+from app.models.trends import TrendEntry
+
+_lock = threading.Lock()
+_metadata: Optional[DatasetMetadata] = None
+_refreshing = False
+
+
+def get_dataset_metadata() -> DatasetMetadata:
+    """
+    Metadata of the imported data, served from memory. It is refreshed by the import, other processes
+    reload it in the background when the data generation changes and serve the previous metadata meanwhile.
+    """
+    global _refreshing
+    if _metadata is None:
+        refresh_dataset_metadata()
+    elif _metadata.generation != get_data_generation():
+        with _lock:
+            refresh = not _refreshing
+            _refreshing = True
+        if refresh:
+            threading.Thread(target=refresh_dataset_metadata, name="dataset-metadata", daemon=True).start()
+    return _metadata
+
+
+def refresh_dataset_metadata(generation: Optional[int] = None):
+    """Load date range, row counts and countries of the imported data in a single query"""
+    global _metadata, _refreshing
+    try:
+        generation = get_data_generation() if generation is None else generation
+
+        statement = select(
+            select(func.min(TrendEntry.date)).scalar_subquery(),
+            select(func.max(TrendEntry.date)).scalar_subquery(),
+            select(func.count()).select_from(TrendEntry).scalar_subquery(),
+            select(func.array_agg(distinct(TrendEntry.country_code))).scalar_subquery(),
+            select(func.count()).select_from(Track).scalar_subquery(),
+            select(func.count()).select_from(Album).scalar_subquery(),
+            select(func.count()).select_from(Artist).scalar_subquery(),
+        )
+        with engine.connect() as connection:
+            from_date, to_date, trend_entry_count, country_codes, track_count, album_count, artist_count = (
+                connection.execute(statement).one()
+            )
+
+        metadata = DatasetMetadata(
+            generation=generation,
+            from_date=from_date,
+            to_date=to_date,
+            trend_entry_count=trend_entry_count,
+            track_count=track_count,
+            album_count=album_count,
+            artist_count=artist_count,
+            country_codes=sorted(country_codes or []),
+        )
+        with _lock:
+            _metadata = metadata
+    finally:
+        with _lock:
+            _refreshing = False
@@ -0,0 +1,97 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+from fastapi import UploadFile
+
+from app.business.data_import import load_songs_from_csv
+from app.models.exceptions import NotFoundException
+from app.models.imports import ImportJob, ImportJobStatus
+
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Number of finished jobs that are kept to be retrieved
+_MAX_FINISHED_JOBS = 100
+
+_jobs: dict[str, ImportJob] = {}
+_tasks: dict[str, asyncio.Task] = {}
+
+
+async def create_import_job(file: UploadFile) -> ImportJob:
+    """Stream the uploaded file to disk and queue its import as a background job"""
+    job = ImportJob(
+        id=str(uuid.uuid4()),
+        file_name=os.path.basename(file.filename or "upload.csv"),
+        created_at=datetime.datetime.now(),
+    )
+
+    directory = tempfile.mkdtemp(prefix=f"import-{job.id}-")
+    path = os.path.join(directory, job.file_name)
+    checksum = hashlib.sha256()
+    try:
+        with open(path, "wb") as target:
+            while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+                checksum.update(chunk)
+                await asyncio.to_thread(target.write, chunk)
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    finally:
+        await file.close()
+
+    _jobs[job.id] = job
+    # Uploads are tracked by their content, so they never share the manifest of the Kaggle file or another upload
+    _tasks[job.id] = asyncio.create_task(_run_import_job(job, path, f"upload-{checksum.hexdigest()}"))
+    return job
+
+
+def get_import_jobs() -> list[ImportJob]:
+    return sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+def get_import_job(job_id: str) -> ImportJob:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise NotFoundException(f"There is no import job with ID \"{job_id}\".")
+    return job
+
+
+def cancel_import_job(job_id: str) -> ImportJob:
+    job = get_import_job(job_id)
+    task = _tasks.get(job_id)
+    if task is not None and not task.done():
+        task.cancel()
+    return job
+
+
+async def _run_import_job(job: ImportJob, path: str, source: str):
+    try:
+        job.status = ImportJobStatus.RUNNING
+        from_date, until_date = await load_songs_from_csv(path, job.progress, source)
+
+        job.status = ImportJobStatus.SUCCEEDED
+        if from_date is not None and until_date is not None:
+            job.message = f"Successfully imported spotify trend data for {from_date} - {until_date}"
+        else:
+            job.message = "No new data to import found."
+    except asyncio.CancelledError:
+        job.status = ImportJobStatus.CANCELLED
+        job.message = "Import has been cancelled."
+    except Exception as e:
+        job.status = ImportJobStatus.FAILED
+        job.message = str(e)
+    finally:
+        job.finished_at = datetime.datetime.now()
+        _tasks.pop(job.id, None)
+        _prune_jobs()
+        # The import only returns (or is cancelled) once its worker threads are done with the file
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def _prune_jobs():
+    finished = sorted((job for job in _jobs.values() if job.finished_at is not None), key=lambda job: job.finished_at)
+    for job in finished[:max(len(finished) - _MAX_FINISHED_JOBS, 0)]:
+        del _jobs[job.id]
@@ -0,0 +1,73 @@
+import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models.imports import ImportRun, ImportRunStatus, ImportCheckpoint, CheckpointStage
+
+
+class ImportJournal:
+    """
+    Journal of an import run with a checkpoint per day and stage.
+    Checkpoints are written in the same transaction as the data they stand for,
+    so a resumed run continues exactly after the last committed day.
+    """
+
+    def __init__(self, run_id: int, checkpoints: set[tuple[datetime.datetime, CheckpointStage]]):
+        self.run_id = run_id
+        self._checkpoints = checkpoints
+        # Whether data has been written by this run
+        self.has_changes = False
+
+    @classmethod
+    def start(cls, source: str) -> "ImportJournal":
+        """
+        Resume the last run of the source if it has not succeeded or start a new run.
+        Must only be called while holding the import lock: a run that is still marked as running then belongs to
+        a process that died before it could finish the run.
+        """
+        with Session(engine) as session:
+            run = session.exec(
+                select(ImportRun).where(ImportRun.source == source).order_by(ImportRun.started_at.desc())
+            ).first()
+
+            if run is None or run.status == ImportRunStatus.SUCCEEDED:
+                run = ImportRun(source=source, status=ImportRunStatus.RUNNING, started_at=datetime.datetime.now())
+                session.add(run)
+                checkpoints = set()
+            else:
+                print(f"Resuming import run {run.id} of {source}...")
+                run.status = ImportRunStatus.RUNNING
+                checkpoints = {
+                    (checkpoint.snapshot_date, checkpoint.stage) for checkpoint in session.exec(
+                        select(ImportCheckpoint).where(ImportCheckpoint.run_id == run.id)
+                    ).all()
+                }
+            session.commit()
+            return cls(run.id, checkpoints)
+
+    def is_done(self, snapshot_date: datetime.datetime, stage: CheckpointStage) -> bool:
+        return (snapshot_date, stage) in self._checkpoints
+
+    def dates(self, stage: CheckpointStage) -> list[datetime.datetime]:
+        return sorted(snapshot_date for snapshot_date, checkpoint_stage in self._checkpoints if checkpoint_stage == stage)
+
+    def add_checkpoints(self, checkpoints: list[tuple[datetime.datetime, int]], stage: CheckpointStage, session: Session):
+        """Add checkpoints for the given days to the transaction of the session"""
+        if len(checkpoints) == 0:
+            return
+
+        self.has_changes = True
+        now = datetime.datetime.now()
+        session.execute(insert(ImportCheckpoint.__table__).on_conflict_do_nothing(), [
+            dict(run_id=self.run_id, snapshot_date=snapshot_date, stage=stage, row_count=row_count, created_at=now)
+            for snapshot_date, row_count in checkpoints
+        ])
+
+    def finish(self, status: ImportRunStatus):
+        with Session(engine) as session:
+            run = session.get(ImportRun, self.run_id)
+            run.status = status
+            run.finished_at = datetime.datetime.now()
+            session.commit()
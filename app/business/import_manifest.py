@@ -0,0 +1,269 @@
+import csv
+import datetime
+import hashlib
+import io
+import os
+from typing import BinaryIO, Iterator, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlmodel import Session, select, delete
+
+from app.database import engine
+from app.models.imports import ImportedFile, ImportManifestEntry
+from app.models.trends import TrendEntry
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+class CsvImportPlan(BaseModel):
+    """Byte range [start, end) of a CSV file that has not been imported yet"""
+    file_name: str
+    start: int
+    end: int
+    # Offset of the previously imported segments in the current file (new rows prepended)
+    shift: int = 0
+    # Whether the manifest of the file no longer matches and has to be rebuilt
+    reset: bool = False
+
+    @property
+    def is_empty(self) -> bool:
+        return self.start >= self.end
+
+
+def plan_csv_import(path: str, file_name: Optional[str] = None) -> CsvImportPlan:
+    """
+    Determine which part of the CSV file still has to be parsed using the import manifest.
+    Rows appended to or prepended before the previously imported segments are detected,
+    any other change of the file leads to the whole file being parsed again.
+    The same happens if the database no longer contains the imported days (e.g. after a restore).
+    The manifest is kept under the given file name, which defaults to the name of the file.
+    """
+    file_name = file_name or os.path.basename(path)
+    with Session(engine) as session:
+        imported_file = session.get(ImportedFile, file_name)
+        entries = list(session.exec(
+            select(ImportManifestEntry)
+            .where(ImportManifestEntry.file_name == file_name)
+            .order_by(ImportManifestEntry.byte_offset)
+        ).all())
+        max_date = session.exec(select(func.max(TrendEntry.date))).one()
+
+    if len(entries) > 0 and (max_date is None or max_date < max(entry.snapshot_date for entry in entries)):
+        imported_file = None
+    return _plan(path, file_name, imported_file, entries)
+
+
+def _plan(
+    path: str, file_name: str, imported_file: Optional[ImportedFile], entries: list[ImportManifestEntry]
+) -> CsvImportPlan:
+    size = os.path.getsize(path)
+    header = _read_header(path)
+    full_plan = CsvImportPlan(file_name=file_name, start=len(header), end=size, reset=True)
+    if imported_file is None or imported_file.header_checksum != _checksum(header) or len(entries) == 0:
+        return full_plan
+
+    first, last = entries[0], entries[-1]
+    shift = size - imported_file.size
+    if shift < 0:
+        return full_plan
+
+    if _segments_match(path, entries, 0):
+        # New rows have been appended (or the file is unchanged)
+        return CsvImportPlan(file_name=file_name, start=last.byte_offset + last.byte_length, end=size)
+
+    if _segments_match(path, entries, shift):
+        # New rows have been prepended
+        return CsvImportPlan(file_name=file_name, start=len(header), end=first.byte_offset + shift, shift=shift)
+
+    return full_plan
+
+
+def open_csv_range(path: str, plan: CsvImportPlan) -> io.TextIOWrapper:
+    """Open the header and the planned byte range of the CSV file as a single text stream"""
+    return io.TextIOWrapper(
+        io.BufferedReader(_CsvRange(path, _read_header(path), plan.start, plan.end)),
+        encoding="utf-8",
+        newline="",
+    )
+
+
+def record_csv_import(path: str, plan: CsvImportPlan):
+    """Store the segments per snapshot date of the imported byte range in the import manifest"""
+    with Session(engine) as session:
+        if plan.reset:
+            session.execute(delete(ImportManifestEntry).where(ImportManifestEntry.file_name == plan.file_name))
+        entries = {} if plan.reset else {
+            entry.snapshot_date: entry for entry in session.exec(
+                select(ImportManifestEntry).where(ImportManifestEntry.file_name == plan.file_name)
+            ).all()
+        }
+
+        if not _update_entries(path, plan, entries):
+            # Rows are not grouped by date, the whole file will be parsed on the next import
+            session.execute(delete(ImportManifestEntry).where(ImportManifestEntry.file_name == plan.file_name))
+            session.execute(delete(ImportedFile).where(ImportedFile.name == plan.file_name))
+            session.commit()
+            return
+
+        session.merge(_imported_file(path, plan.file_name))
+        session.flush()
+        session.add_all(entries.values())
+        session.commit()
+
+
+def _update_entries(path: str, plan: CsvImportPlan, entries: dict[datetime.datetime, ImportManifestEntry]) -> bool:
+    """
+    Add the segments of the imported byte range to the manifest entries by snapshot date and update their checksums.
+    Returns False if the rows of a date are not stored contiguously.
+    """
+    segments = _scan_segments(path, _read_header(path), plan.start, plan.end)
+    if segments is None:
+        return False
+
+    for entry in entries.values():
+        entry.byte_offset += plan.shift
+
+    for snapshot_date, offset, length, row_count in segments:
+        entry = entries.get(snapshot_date)
+        if entry is None:
+            entries[snapshot_date] = ImportManifestEntry(
+                file_name=plan.file_name,
+                snapshot_date=snapshot_date,
+                byte_offset=offset,
+                byte_length=length,
+                row_count=row_count,
+                checksum="",
+            )
+        elif entry.byte_offset + entry.byte_length == offset:
+            # The last imported day has been continued
+            entry.byte_length += length
+            entry.row_count += row_count
+        elif offset + length == entry.byte_offset:
+            entry.byte_offset = offset
+            entry.byte_length += length
+            entry.row_count += row_count
+        else:
+            return False
+
+    with open(path, "rb") as file:
+        for entry in entries.values():
+            entry.checksum = _segment_checksum(file, entry.byte_offset, entry.byte_length)
+    return True
+
+
+def _imported_file(path: str, file_name: str) -> ImportedFile:
+    return ImportedFile(
+        name=file_name,
+        size=os.path.getsize(path),
+        header_checksum=_checksum(_read_header(path)),
+        imported_at=datetime.datetime.now(),
+    )
+
+
+def _scan_segments(
+    path: str, header: bytes, start: int, end: int
+) -> Optional[list[tuple[datetime.datetime, int, int, int]]]:
+    """
+    Determine the byte offset, length and row count per snapshot date in the byte range.
+    Returns None if the rows of a date are not stored contiguously.
+    """
+    date_index = next(csv.reader([header.decode("utf-8")])).index("snapshot_date")
+    segments = []
+    seen_dates = set()
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        offsets = [start]
+
+        def lines() -> Iterator[str]:
+            while offsets[-1] < end:
+                line = file.readline(end - offsets[-1])
+                if not line:
+                    return
+                offsets.append(offsets[-1] + len(line))
+                yield line.decode("utf-8")
+
+        reader = csv.reader(lines())
+        while True:
+            row_offset = offsets[-1]
+            row = next(reader, None)
+            if row is None:
+                break
+            if len(row) <= date_index:
+                continue
+
+            snapshot_date = datetime.datetime.fromisoformat(row[date_index])
+            if segments and segments[-1][0] == snapshot_date:
+                date, offset, _, row_count = segments[-1]
+                segments[-1] = (date, offset, offsets[-1] - offset, row_count + 1)
+            elif snapshot_date in seen_dates:
+                return None
+            else:
+                seen_dates.add(snapshot_date)
+                segments.append((snapshot_date, row_offset, offsets[-1] - row_offset, 1))
+
+    return segments
+
+
+def _segments_match(path: str, entries: list[ImportManifestEntry], shift: int) -> bool:
+    """Whether all imported segments are still found unchanged in the file, moved by shift bytes"""
+    with open(path, "rb") as file:
+        return all(
+            _segment_checksum(file, entry.byte_offset + shift, entry.byte_length) == entry.checksum
+            for entry in entries
+        )
+
+
+def _segment_checksum(file: BinaryIO, offset: int, length: int) -> Optional[str]:
+    """Checksum of the whole byte range, None if the file ends before the range does"""
+    checksum = hashlib.sha1()
+    file.seek(offset)
+    while length > 0:
+        data = file.read(min(length, _READ_CHUNK_SIZE))
+        if not data:
+            return None
+        checksum.update(data)
+        length -= len(data)
+    return checksum.hexdigest()
+
+
+def _read_header(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.readline()
+
+
+def _checksum(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class _CsvRange(io.RawIOBase):
+    """Raw stream of the header line followed by a byte range of the file"""
+
+    def __init__(self, path: str, header: bytes, start: int, end: int):
+        self._header = header
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._header:
+            size = min(len(buffer), len(self._header))
+            buffer[:size] = self._header[:size]
+            self._header = self._header[size:]
+            return size
+
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
@@ -0,0 +1,199 @@
+import asyncio
+import datetime
+import time
+from typing import Iterator, Optional
+
+import pandas as pd
+from pydantic import BaseModel
+from sqlmodel import Session
+
+from app.business.bulk_writer import copy_trend_entries, write_entities
+from app.business.import_journal import ImportJournal
+from app.business.import_registry import ImportRegistry
+from app.business.rollups import add_day_to_trend_rollups, has_trend_entries, refresh_trend_rollups
+from app.business.spotify import batch_spotify_request, get_tracks_from_spotify, \
+    get_audio_features_from_spotify, get_artists_from_spotify
+from app.database import engine, run_in_thread
+from app.models.configuration import configuration
+from app.models.imports import ImportProgress, ImportStageStats, CheckpointStage
+
+Day = tuple[datetime.datetime, pd.DataFrame]
+
+
+class ResolvedEntities(BaseModel):
+    artists: list[dict]
+    albums: list[dict]
+    tracks: list[dict]
+    audio_features: dict[str, dict]
+
+
+async def run_import_pipeline(
+    days: Iterator[Day], registry: ImportRegistry, progress: ImportProgress, journal: ImportJournal
+) -> list[datetime.datetime]:
+    """
+    Import the days in three stages connected by bounded queues: parsing the file into days,
+    resolving the metadata of new tracks and writing the trend entries.
+    While the trends of a day are written, the following days are already parsed and their metadata resolved.
+    Days and stages that are already checkpointed in the journal are skipped.
+    The throughput of every stage is reported in the progress. Returns the dates of all days in the order of the file.
+    """
+    queue_size = configuration.data_import.pipeline_queue_size
+    parsed_days: asyncio.Queue[Optional[Day]] = asyncio.Queue(maxsize=queue_size)
+    resolved_days: asyncio.Queue[Optional[Day]] = asyncio.Queue(maxsize=queue_size)
+    stats = [ImportStageStats(name="parse"), ImportStageStats(name="resolve"), ImportStageStats(name="write")]
+    progress.stage_stats = stats
+    dates: list[datetime.datetime] = []
+
+    tasks = [
+        asyncio.create_task(_parse_stage(days, parsed_days, stats[0])),
+        asyncio.create_task(_resolve_stage(parsed_days, resolved_days, registry, journal, stats[1])),
+        asyncio.create_task(_write_stage(resolved_days, journal, stats[2], progress, dates)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+        return dates
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for the worker threads of the stages to finish
+        await asyncio.wait(tasks)
+
+
+async def _parse_stage(days: Iterator[Day], output: asyncio.Queue, stats: ImportStageStats):
+    while True:
+        start = time.monotonic()
+        day = await run_in_thread(next, days, None)
+        stats.busy_seconds += time.monotonic() - start
+        if day is None:
+            break
+
+        stats.days += 1
+        stats.rows += len(day[1])
+        await output.put(day)
+    await output.put(None)
+
+
+async def _resolve_stage(
+    input: asyncio.Queue,
+    output: asyncio.Queue,
+    registry: ImportRegistry,
+    journal: ImportJournal,
+    stats: ImportStageStats,
+):
+    """Resolve new tracks in windows of several days, so the Spotify requests are fully packed"""
+    settings = configuration.data_import
+    window: list[Day] = []
+    new_track_ids: dict[str, None] = {}
+
+    while True:
+        day = await input.get()
+        if day is not None:
+            window.append(day)
+            if not journal.is_done(day[0], CheckpointStage.METADATA):
+                new_track_ids.update(dict.fromkeys(registry.unknown_track_ids(day[1]["spotify_id"].unique())))
+
+        if (
+            day is None
+            or len(new_track_ids) == 0
+            or len(new_track_ids) >= settings.resolve_batch_size
+            or len(window) >= settings.pipeline_queue_size
+        ):
+            if len(new_track_ids) > 0:
+                start = time.monotonic()
+                print(f"Resolving metadata for {len(new_track_ids)} new tracks...")
+                entities = await resolve_new_entities(list(new_track_ids), registry)
+                await run_in_thread(_write_entities, entities, registry, journal, window)
+                # Tracks that could not be resolved are not requested again during this import
+                registry.failed_track_ids.update(
+                    track_id for track_id in new_track_ids if track_id not in registry.track_ids
+                )
+                stats.busy_seconds += time.monotonic() - start
+
+            for resolved_day in window:
+                stats.days += 1
+                stats.rows += len(resolved_day[1])
+                await output.put(resolved_day)
+            window, new_track_ids = [], {}
+
+        if day is None:
+            await output.put(None)
+            return
+
+
+async def _write_stage(
+    input: asyncio.Queue,
+    journal: ImportJournal,
+    stats: ImportStageStats,
+    progress: ImportProgress,
+    dates: list[datetime.datetime],
+):
+    while True:
+        day = await input.get()
+        if day is None:
+            return
+
+        date, day_df = day
+        start = time.monotonic()
+        if journal.is_done(date, CheckpointStage.TRENDS):
+            print(f"Trends for {date} have already been loaded. Skipping...")
+        else:
+            print(f"Loading trends for {date} ({len(day_df)} entries)...")
+            await run_in_thread(_write_trends, date, day_df, journal)
+        stats.busy_seconds += time.monotonic() - start
+        stats.days += 1
+        stats.rows += len(day_df)
+        progress.add_day(len(day_df))
+        dates.append(date)
+
+
+async def resolve_new_entities(track_ids: list[str], registry: ImportRegistry) -> ResolvedEntities:
+    resolved_new_tracks, resolved_audio_features = await asyncio.gather(
+        batch_spotify_request(track_ids, get_tracks_from_spotify, 100, entity_type="tracks"),
+        batch_spotify_request(track_ids, get_audio_features_from_spotify, 100, entity_type="audio-features"),
+    )
+
+    new_albums = list(
+        {t["album"]["id"]: t["album"] for t in resolved_new_tracks if t["album"]["id"] not in registry.album_ids}
+        .values()
+    )
+
+    # Album and track artists are resolved together to fill the batches
+    new_artist_ids = list(dict.fromkeys(
+        artist["id"] for artist in [
+            *(artist for album in new_albums for artist in album["artists"]),
+            *(artist for t in resolved_new_tracks for artist in t["artists"]),
+        ]
+        if artist["id"] not in registry.artist_ids
+    ))
+    resolved_artists = await batch_spotify_request(
+        new_artist_ids, get_artists_from_spotify, 10, entity_type="artists"
+    )
+
+    return ResolvedEntities(
+        artists=resolved_artists,
+        albums=new_albums,
+        tracks=resolved_new_tracks,
+        audio_features={feat["id"]: feat for feat in resolved_audio_features},
+    )
+
+
+def _write_entities(entities: ResolvedEntities, registry: ImportRegistry, journal: ImportJournal, days: list[Day]):
+    with Session(engine) as session:
+        write_entities(
+            entities.artists, entities.albums, entities.tracks, entities.audio_features, session, registry
+        )
+        journal.add_checkpoints([(date, len(df)) for date, df in days], CheckpointStage.METADATA, session)
+        session.commit()
+
+
+def _write_trends(date: datetime.datetime, df: pd.DataFrame, journal: ImportJournal):
+    with Session(engine) as session:
+        is_new_day = not has_trend_entries(date, session)
+        row_count = copy_trend_entries(df, session)
+        # The rollups are updated in the same transaction, so they always cover exactly the committed days
+        if is_new_day:
+            add_day_to_trend_rollups(date, session)
+        elif row_count > 0:
+            refresh_trend_rollups(date, date, session)
+        journal.add_checkpoints([(date, row_count)], CheckpointStage.TRENDS, session)
+        session.commit()
@@ -0,0 +1,31 @@
+from typing import Iterable
+
+from sqlmodel import Session, select
+
+from app.models.albums import Album
+from app.models.artists import Artist
+from app.models.tracks import Track
+
+
+class ImportRegistry:
+    """IDs of the tracks, albums and artists known to the database during an import run"""
+
+    def __init__(self, track_ids: set[str], album_ids: set[str], artist_ids: set[str]):
+        self.track_ids = track_ids
+        self.album_ids = album_ids
+        self.artist_ids = artist_ids
+        self.failed_track_ids: set[str] = set()
+
+    @classmethod
+    def load(cls, session: Session) -> "ImportRegistry":
+        return cls(
+            track_ids=set(session.exec(select(Track.id)).all()),
+            album_ids=set(session.exec(select(Album.id)).all()),
+            artist_ids=set(session.exec(select(Artist.id)).all()),
+        )
+
+    def unknown_track_ids(self, track_ids: Iterable[str]) -> list[str]:
+        return list(dict.fromkeys(
+            track_id for track_id in track_ids
+            if track_id not in self.track_ids and track_id not in self.failed_track_ids
+        ))
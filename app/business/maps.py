@@ -2,21 +2,25 @@ import json
 
 from geoalchemy2 import functions as func
 from sqlalchemy import select
-from sqlmodel import Session, or_
+from sqlmodel import Session
 
 from app.database import engine
 from app.models.albums import AlbumPublicWithArtists
 from app.models.artists import Artist
-from app.models.countries import Country
+from app.models.countries import Country, CountryGeometry, GeometryDetail
 from app.models.maps import FeatureCollection, Properties
 from app.models.tracks import TrackPublicWithAlbumAndArtists
 
 
-async def get_map_with_features(country_feature_dict: dict[str, float | Artist | TrackPublicWithAlbumAndArtists | AlbumPublicWithArtists], feature_key: str) -> FeatureCollection:
+def get_map_with_features(
+    country_feature_dict: dict[str, float | Artist | TrackPublicWithAlbumAndArtists | AlbumPublicWithArtists],
+    feature_key: str,
+    detail: GeometryDetail = GeometryDetail.MEDIUM
+) -> FeatureCollection:
     try:
         with (Session(engine) as session):
-            statement = select(func.ST_AsGeoJSON(Country)).where(or_(False, *[Country.alpha_2_code == country for country in country_feature_dict.keys()]))
-            countries = session.exec(statement).all()
+            statement = _country_geometries(list(country_feature_dict.keys()), detail)
+            countries = session.exec(select(func.ST_AsGeoJSON(statement))).all()
             loaded_countries = []
             for c in countries:
                 loaded_country = json.loads(c[0])
@@ -29,3 +33,14 @@ async def get_map_with_features(country_feature_dict: dict[str, float | Artist |
         print(str(e)[100:])
         raise e
 
+
+def _country_geometries(country_codes: list[str], detail: GeometryDetail):
+    if detail == GeometryDetail.FULL:
+        statement = select(Country.alpha_2_code, Country.name, Country.polygon)
+    else:
+        statement = (
+            select(Country.alpha_2_code, Country.name, CountryGeometry.polygon)
+            .join(CountryGeometry, CountryGeometry.alpha_2_code == Country.alpha_2_code)
+            .where(CountryGeometry.detail == detail)
+        )
+    return statement.where(Country.alpha_2_code.in_(country_codes)).subquery()
@@ -1,70 +1,76 @@
 import datetime
 from typing import Optional
 
-from sqlmodel import Session, select, or_
+from sqlmodel import Session, select
 
-from sqlalchemy import func
+from sqlalchemy import func, exists
 
-from app.business.utils import add_date_filter
+from app.business.analytics import get_trend_analytics
+from app.business.rollups import trend_scores
 from app.database import engine
 from app.models.albums import Album
 from app.models.artists import Artist
 from app.models.exceptions import NotFoundException
 from app.models.tracks import Track
-from app.models.trends import TrendEntry
+from app.models.trends import RollupEntity
 
 
-async def calculate_album_popularity(
+def calculate_album_popularity(
     album_id: str,
     from_date: Optional[datetime.datetime] = None,
     to_date: Optional[datetime.datetime] = None,
 ) -> dict[str, float]:
     with (Session(engine) as session):
-        album = session.get(Album, album_id)
-        if not album:
+        if not _exists(session, Album, album_id):
             raise NotFoundException(f"There is no album with ID \"{album_id}\".")
-        where_filter = or_(*[TrendEntry.track_id == track.id for track in album.tracks])
-        return await _calculate_popularity(session, where_filter, from_date, to_date)
+        return _calculate_popularity(session, RollupEntity.ALBUM, album_id, from_date, to_date)
 
 
-async def calculate_artist_popularity(
+def calculate_artist_popularity(
     artist_id: str,
     from_date: Optional[datetime.datetime] = None,
     to_date: Optional[datetime.datetime] = None,
 ) -> dict[str, float]:
     with (Session(engine) as session):
-        artist = session.get(Artist, artist_id)
-        if not artist:
+        if not _exists(session, Artist, artist_id):
             raise NotFoundException(f"There is no artist with ID \"{artist_id}\".")
-        where_filter = or_(*[TrendEntry.track_id == track.id for track in artist.tracks])
-        return await _calculate_popularity(session, where_filter, from_date, to_date)
+        return _calculate_popularity(session, RollupEntity.ARTIST, artist_id, from_date, to_date)
 
 
-async def calculate_track_popularity(
+def calculate_track_popularity(
     track_id: str,
     from_date: Optional[datetime.datetime] = None,
     to_date: Optional[datetime.datetime] = None,
 ) -> dict[str, float]:
     with (Session(engine) as session):
-        if not session.get(Track, track_id):
+        if not _exists(session, Track, track_id):
             raise NotFoundException(f"There is no track with ID \"{track_id}\".")
-        where_filter = TrendEntry.track_id == track_id
-        return await _calculate_popularity(session, where_filter, from_date, to_date)
+        return _calculate_popularity(session, RollupEntity.TRACK, track_id, from_date, to_date)
 
 
-async def _calculate_popularity(
+def _exists(session: Session, model, entity_id: str) -> bool:
+    # Answered by the primary key index
+    return session.exec(select(exists().where(model.id == entity_id))).one()
+
+
+def _calculate_popularity(
     session: Session,
-    where_filter,
+    entity_type: RollupEntity,
+    entity_id: str,
     from_date: Optional[datetime.datetime] = None,
     to_date: Optional[datetime.datetime] = None,
 ):
-    statement = (
-        select(TrendEntry.country_code,
-               (func.sum(51 - TrendEntry.rank)))
-        .group_by(TrendEntry.country_code)
-    ).where(where_filter)
+    analytics = get_trend_analytics()
+    if analytics is not None:
+        return analytics.popularity(entity_type, entity_id, from_date, to_date)
 
-    statement = add_date_filter(statement, from_date, to_date)
+    # Album and artist scores are aggregated through tracks / track artist links by the rollups
+    scores = trend_scores(entity_type, from_date, to_date)
+    statement = (
+        select(scores.c.country_code,
+               (func.sum(scores.c.score)))
+        .group_by(scores.c.country_code)
+    ).where(scores.c.entity_id == entity_id)
 
     res = list(session.exec(statement).all())
     country_scores = {country_score[0]: country_score[1] for country_score in res}
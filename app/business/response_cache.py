@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.models.configuration import configuration
+
+
+class SharedResponseStore:
+    """SQLite store of serialized responses shared by the workers of a host, only the current generation is kept"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " generation INTEGER NOT NULL,"
+            " body BLOB NOT NULL,"
+            " created_at REAL NOT NULL"
+            ")"
+        )
+        self._connection.commit()
+
+    def get(self, generation: int, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body FROM responses WHERE key = ? AND generation = ?", [key, generation]
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, generation: int, key: str, body: bytes):
+        with self._lock:
+            if self._generation != generation:
+                self._connection.execute("DELETE FROM responses WHERE generation < ?", [generation])
+                self._generation = generation
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, generation, body, created_at) VALUES (?, ?, ?, ?)",
+                [key, generation, body, time.time()]
+            )
+            self._connection.commit()
+
+
+class ResponseCache:
+    """
+    Serialized endpoint results of the current data generation, in a memory-bounded LRU
+    in front of an optional shared store. Entries of older generations are dropped as soon as a new one is seen.
+    """
+
+    def __init__(self, max_memory_bytes: int, shared_store: Optional[SharedResponseStore] = None):
+        self._max_memory_bytes = max_memory_bytes
+        self._shared_store = shared_store
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._generation: Optional[int] = None
+
+    @property
+    def has_shared_store(self) -> bool:
+        return self._shared_store is not None
+
+    def get(self, generation: int, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._set_generation(generation)
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+
+        if self._shared_store is not None:
+            body = self._shared_store.get(generation, key)
+            if body is not None:
+                self._put_memory(generation, key, body)
+        return body
+
+    def put(self, generation: int, key: str, body: bytes):
+        self._put_memory(generation, key, body)
+        if self._shared_store is not None:
+            self._shared_store.put(generation, key, body)
+
+    def _put_memory(self, generation: int, key: str, body: bytes):
+        if len(body) > self._max_memory_bytes:
+            return
+
+        with self._lock:
+            self._set_generation(generation)
+            if key in self._entries:
+                self._memory_bytes -= len(self._entries.pop(key))
+            self._entries[key] = body
+            self._memory_bytes += len(body)
+            while self._memory_bytes > self._max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _set_generation(self, generation: int):
+        if self._generation != generation:
+            self._entries.clear()
+            self._memory_bytes = 0
+            self._generation = generation
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    global _cache
+    if _cache is None and configuration.response_cache.enabled:
+        shared_path = configuration.response_cache.shared_path
+        _cache = ResponseCache(
+            max_memory_bytes=configuration.response_cache.max_memory_bytes,
+            shared_store=SharedResponseStore(shared_path) if shared_path is not None else None,
+        )
+    return _cache
@@ -0,0 +1,207 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import func, literal, delete, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from app.business.utils import day_bounds
+from app.database import engine
+from app.models.links import TrackArtistLink
+from app.models.tracks import Track
+from app.models.trends import TrendEntry, TrendRollup, RollupEntity, RollupGranularity
+
+_ROLLUP_COLUMNS = ["entity_type", "granularity", "period_start", "country_code", "entity_id", "score"]
+
+
+def trend_scores(
+    entity_type: RollupEntity,
+    from_date: Optional[datetime.datetime] = None,
+    to_date: Optional[datetime.datetime] = None,
+):
+    """
+    Subquery with the scores (51 - rank) of the entities per country within the date range as
+    (country_code, entity_id, score) rows, which have to be summed up by the caller.
+    The range is covered by monthly and weekly rollups, only the days at its edges are read from the trend entries.
+    """
+    first_day, end_day = day_bounds(from_date, to_date)
+
+    parts = []
+    for granularity, lower, upper in _plan_range(first_day, end_day):
+        if granularity is None:
+            parts.append(_raw_scores(entity_type, lower, upper))
+        else:
+            parts.append(_rollup_scores(entity_type, granularity, lower, upper))
+    if len(parts) == 0:
+        # The range does not contain a whole day
+        parts.append(_raw_scores(entity_type, first_day, first_day))
+
+    return union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+
+
+def refresh_trend_rollups(
+    from_date: datetime.datetime, to_date: datetime.datetime, session: Optional[Session] = None
+):
+    """Recalculate all weekly and monthly rollups that cover the days between from_date and to_date"""
+    if session is None:
+        with Session(engine) as session:
+            refresh_trend_rollups(from_date, to_date, session)
+            session.commit()
+        return
+
+    for granularity in RollupGranularity:
+        lower = _period_start(granularity, from_date)
+        upper = _next_period(granularity, _period_start(granularity, to_date))
+        session.execute(
+            delete(TrendRollup).where(
+                TrendRollup.granularity == granularity,
+                TrendRollup.period_start >= lower,
+                TrendRollup.period_start < upper,
+            )
+        )
+        for entity_type in RollupEntity:
+            session.execute(
+                insert(TrendRollup.__table__).from_select(
+                    _ROLLUP_COLUMNS, _aggregate_period(entity_type, granularity, lower, upper)
+                )
+            )
+
+
+def add_day_to_trend_rollups(day: datetime.datetime, session: Session):
+    """Add the scores of a day, whose trend entries have all been inserted in this transaction, to its rollups"""
+    day = datetime.datetime.combine(day.date(), datetime.time())
+    for granularity in RollupGranularity:
+        for entity_type in RollupEntity:
+            statement = insert(TrendRollup.__table__).from_select(
+                _ROLLUP_COLUMNS, _aggregate_period(entity_type, granularity, day, day + datetime.timedelta(days=1))
+            )
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[c for c in _ROLLUP_COLUMNS if c != "score"],
+                set_=dict(score=TrendRollup.__table__.c.score + statement.excluded.score),
+            ))
+
+
+def has_trend_entries(day: datetime.datetime, session: Session) -> bool:
+    day = datetime.datetime.combine(day.date(), datetime.time())
+    return session.exec(
+        select(TrendEntry.date)
+        .where(TrendEntry.date >= day, TrendEntry.date < day + datetime.timedelta(days=1))
+        .limit(1)
+    ).first() is not None
+
+
+def backfill_trend_rollups():
+    """Build the rollups for databases that contain trend entries imported before the rollups existed"""
+    with Session(engine) as session:
+        if session.exec(select(TrendRollup.entity_id).limit(1)).first() is not None:
+            return
+        from_date, to_date = session.exec(select(func.min(TrendEntry.date), func.max(TrendEntry.date))).one()
+
+    if from_date is not None:
+        print("Building trend rollups...")
+        refresh_trend_rollups(from_date, to_date)
+
+
+def _plan_range(
+    first_day: Optional[datetime.datetime], end_day: Optional[datetime.datetime]
+) -> list[tuple[Optional[RollupGranularity], Optional[datetime.datetime], Optional[datetime.datetime]]]:
+    """Split [first_day, end_day) into full months, full weeks and single days (granularity None)"""
+    months_start = None if first_day is None else _ceil_period(RollupGranularity.MONTH, first_day)
+    months_end = None if end_day is None else _period_start(RollupGranularity.MONTH, end_day)
+
+    if months_start is not None and months_end is not None and months_start >= months_end:
+        plan, edges = [], [(first_day, end_day)]
+    else:
+        plan, edges = [(RollupGranularity.MONTH, months_start, months_end)], []
+        if first_day is not None:
+            edges.append((first_day, months_start))
+        if end_day is not None:
+            edges.append((months_end, end_day))
+
+    for lower, upper in edges:
+        if lower >= upper:
+            continue
+        weeks_start = _ceil_period(RollupGranularity.WEEK, lower)
+        weeks_end = _period_start(RollupGranularity.WEEK, upper)
+        if weeks_start < weeks_end:
+            plan.append((RollupGranularity.WEEK, weeks_start, weeks_end))
+            plan += [(None, day, end) for day, end in [(lower, weeks_start), (weeks_end, upper)] if day < end]
+        else:
+            plan.append((None, lower, upper))
+    return plan
+
+
+def _rollup_scores(
+    entity_type: RollupEntity,
+    granularity: RollupGranularity,
+    lower: Optional[datetime.datetime],
+    upper: Optional[datetime.datetime],
+):
+    statement = (
+        select(TrendRollup.country_code, TrendRollup.entity_id, TrendRollup.score)
+        .where(TrendRollup.entity_type == entity_type, TrendRollup.granularity == granularity)
+    )
+    if lower is not None:
+        statement = statement.where(TrendRollup.period_start >= lower)
+    if upper is not None:
+        statement = statement.where(TrendRollup.period_start < upper)
+    return statement
+
+
+def _raw_scores(entity_type: RollupEntity, lower: datetime.datetime, upper: datetime.datetime):
+    return _with_entity(
+        select(TrendEntry.country_code, _entity_column(entity_type), (51 - TrendEntry.rank).label("score")),
+        entity_type,
+    ).where(TrendEntry.date >= lower, TrendEntry.date < upper)
+
+
+def _aggregate_period(
+    entity_type: RollupEntity, granularity: RollupGranularity, lower: datetime.datetime, upper: datetime.datetime
+):
+    period_start = func.date_trunc(granularity.value, TrendEntry.date)
+    entity_id = _entity_column(entity_type)
+    return _with_entity(
+        select(
+            literal(entity_type, TrendRollup.__table__.c.entity_type.type),
+            literal(granularity, TrendRollup.__table__.c.granularity.type),
+            period_start,
+            TrendEntry.country_code,
+            entity_id,
+            func.sum(51 - TrendEntry.rank),
+        ),
+        entity_type,
+    ).where(TrendEntry.date >= lower, TrendEntry.date < upper).group_by(period_start, TrendEntry.country_code, entity_id)
+
+
+def _entity_column(entity_type: RollupEntity):
+    return {
+        RollupEntity.TRACK: TrendEntry.track_id,
+        RollupEntity.ALBUM: Track.album_id,
+        RollupEntity.ARTIST: TrackArtistLink.artist_id,
+    }[entity_type].label("entity_id")
+
+
+def _with_entity(statement, entity_type: RollupEntity):
+    if entity_type == RollupEntity.ALBUM:
+        return statement.join(Track, Track.id == TrendEntry.track_id)
+    if entity_type == RollupEntity.ARTIST:
+        return statement.join(TrackArtistLink, TrackArtistLink.track_id == TrendEntry.track_id)
+    return statement
+
+
+def _period_start(granularity: RollupGranularity, date: datetime.datetime) -> datetime.datetime:
+    day = datetime.datetime.combine(date.date(), datetime.time())
+    if granularity == RollupGranularity.WEEK:
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _next_period(granularity: RollupGranularity, period_start: datetime.datetime) -> datetime.datetime:
+    if granularity == RollupGranularity.WEEK:
+        return period_start + datetime.timedelta(days=7)
+    return (period_start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _ceil_period(granularity: RollupGranularity, day: datetime.datetime) -> datetime.datetime:
+    period_start = _period_start(granularity, day)
+    return period_start if period_start == day else _next_period(granularity, period_start)
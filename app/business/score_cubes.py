@@ -0,0 +1,96 @@
+from typing import Optional
+
+import numpy as np
+
+# Sorting key of a daily score: country (8 bits) | entity (32 bits) | day ordinal (16 bits)
+_COUNTRY_BITS = 8
+_ENTITY_BITS = 32
+_DAY_BITS = 16
+_MAX_DAY = 1 << _DAY_BITS
+
+
+class ScoreCube:
+    """
+    Prefix sums of the daily scores of every (country, entity) pair, ordered by pair and day.
+    The score of a pair within any date range is the difference of two prefix sums, found by binary search.
+    """
+
+    def __init__(self, keys: np.ndarray, prefix: np.ndarray):
+        self.keys = keys
+        self.prefix = prefix
+        # The keys are sorted, so the pairs are found without sorting again
+        pair_keys = keys >> _DAY_BITS
+        is_first = np.ones(len(pair_keys), dtype=bool)
+        is_first[1:] = pair_keys[1:] != pair_keys[:-1]
+        self.pairs = pair_keys[is_first]
+        self.num_countries = int(self.pairs[-1] >> _ENTITY_BITS) + 1 if len(self.pairs) > 0 else 0
+
+    @classmethod
+    def empty(cls) -> "ScoreCube":
+        return cls(np.empty(0, np.int64), np.zeros(1, np.int64))
+
+    def extended(self, countries: np.ndarray, entities: np.ndarray, days: np.ndarray, scores: np.ndarray) -> "ScoreCube":
+        """
+        Copy of the cube including the given scores.
+        Only the new scores are sorted, they are merged into the existing keys in linear time.
+        """
+        if len(scores) == 0:
+            return self
+
+        # Values outside of their bits would silently corrupt the keys of other pairs
+        _check_bounds("Country", countries, 1 << _COUNTRY_BITS)
+        _check_bounds("Entity", entities, 1 << _ENTITY_BITS)
+        _check_bounds("Day", days, _MAX_DAY)
+
+        new_keys, groups = np.unique(
+            _pair(countries, entities) << _DAY_BITS | days.astype(np.int64), return_inverse=True
+        )
+        new_scores = np.bincount(groups, weights=scores, minlength=len(new_keys)).astype(np.int64)
+
+        # Scores of days the cube already contains are added, all other keys are inserted at their position
+        daily_scores = np.diff(self.prefix)
+        positions = np.searchsorted(self.keys, new_keys)
+        is_known = positions < len(self.keys)
+        is_known[is_known] = self.keys[positions[is_known]] == new_keys[is_known]
+        daily_scores[positions[is_known]] += new_scores[is_known]
+
+        keys = np.insert(self.keys, positions[~is_known], new_keys[~is_known])
+        daily_scores = np.insert(daily_scores, positions[~is_known], new_scores[~is_known])
+        prefix = np.zeros(len(keys) + 1, np.int64)
+        np.cumsum(daily_scores, out=prefix[1:])
+        return ScoreCube(keys, prefix)
+
+    def range_scores(
+        self,
+        first_day: Optional[int],
+        end_day: Optional[int],
+        country: Optional[int] = None,
+        entity: Optional[int] = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score per (country, entity) within [first_day, end_day) as (countries, entities, scores) arrays"""
+        if entity is not None:
+            pairs = _pair(np.arange(self.num_countries), np.full(self.num_countries, entity))
+        else:
+            pairs = self.pairs
+        if country is not None:
+            pairs = pairs[np.searchsorted(pairs, country << _ENTITY_BITS):np.searchsorted(pairs, (country + 1) << _ENTITY_BITS)]
+
+        first_day = 0 if first_day is None else min(max(first_day, 0), _MAX_DAY)
+        end_day = _MAX_DAY if end_day is None else min(max(end_day, 0), _MAX_DAY)
+        starts = np.searchsorted(self.keys, (pairs << _DAY_BITS) + first_day)
+        ends = np.searchsorted(self.keys, (pairs << _DAY_BITS) + max(end_day, first_day))
+        scores = self.prefix[ends] - self.prefix[starts]
+
+        # Pairs without entries in the range are not part of the result (like in a grouped query)
+        keep = scores > 0
+        pairs, scores = pairs[keep], scores[keep]
+        return pairs >> _ENTITY_BITS, pairs & ((1 << _ENTITY_BITS) - 1), scores
+
+
+def _pair(countries: np.ndarray, entities: np.ndarray) -> np.ndarray:
+    return countries.astype(np.int64) << _ENTITY_BITS | entities.astype(np.int64)
+
+
+def _check_bounds(name: str, values: np.ndarray, limit: int):
+    if len(values) > 0 and (values.min() < 0 or values.max() >= limit):
+        raise ValueError(f"{name} indices have to be within [0, {limit}).")
@@ -0,0 +1,243 @@
+import asyncio
+import datetime
+import email.utils
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Awaitable, Optional
+
+import requests
+from playwright.async_api import async_playwright
+from requests.adapters import HTTPAdapter
+
+from app.business.spotify_cache import get_spotify_cache
+from app.database import run_in_thread
+from app.models.configuration import configuration
+
+
+class SpotifyClient:
+    """
+    Spotify Web API client with a pool of keep-alive connections.
+    Requests are executed on a bounded thread pool, so they never block the event loop
+    and at most max_concurrent_requests requests are in flight at the same time.
+    """
+
+    def __init__(self, api_url: str, max_concurrent_requests: int, max_retries: int, timeout_seconds: float):
+        self._api_url = api_url
+        self._max_retries = max_retries
+        self._timeout_seconds = timeout_seconds
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_requests, thread_name_prefix="spotify")
+
+    async def request(self, method: str, path: str, params: dict, access_token: str) -> dict | list[dict]:
+        loop = asyncio.get_running_loop()
+        retries = 0
+        while retries < self._max_retries:
+            try:
+                response = await loop.run_in_executor(self._executor, partial(
+                    self._session.request,
+                    method,
+                    self._api_url + path,
+                    headers={"Authorization": f"Bearer {access_token}"},
+                    params=params,
+                    timeout=self._timeout_seconds,
+                ))
+            except requests.RequestException as e:
+                print(f"Got an error attempting {method} on {path}: {e}")
+                response = None
+
+            if response is not None and response.ok:
+                return response.json()
+
+            if response is not None:
+                print(
+                    f"Got an error attempting {method} on {path}: "
+                    f"{response.text} [{response.status_code}]"
+                )
+
+                if response.status_code == 401 and configuration.spotify.access_token is None:
+                    # Refresh the access token
+                    access_token = await get_access_token_provider().refresh(rejected_token=access_token)
+
+            retries += 1
+            await asyncio.sleep(_retry_delay(response, retries))
+            logging.info(f"Retrying...")
+        else:
+            raise Exception(f"Failed {method} on {path}")
+
+
+def _retry_delay(response: Optional[requests.Response], retries: int) -> float:
+    """Wait requested by the Retry-After header (in seconds or as HTTP date), otherwise a linear backoff"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return min(int(retry_after), configuration.spotify.max_retry_after_seconds)
+    if retry_after is not None:
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            retry_at = None
+        if retry_at is not None:
+            if retry_at.tzinfo is None:
+                # HTTP dates are always given in GMT
+                retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+            delay = (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            return min(max(delay, 0), configuration.spotify.max_retry_after_seconds)
+    return configuration.spotify.retry_backoff_seconds * retries
+
+
+_client: Optional[SpotifyClient] = None
+
+
+def get_spotify_client() -> SpotifyClient:
+    global _client
+    if _client is None:
+        _client = SpotifyClient(
+            api_url=configuration.spotify.api_url,
+            max_concurrent_requests=configuration.spotify.max_concurrent_requests,
+            max_retries=configuration.spotify.max_retries,
+            timeout_seconds=configuration.spotify.timeout_seconds,
+        )
+    return _client
+
+
+class AccessTokenProvider:
+    """
+    Caches the Spotify access token until shortly before it expires.
+    Concurrent refreshes share a single browser launch.
+    """
+
+    def __init__(self, ttl_seconds: float, refresh_margin_seconds: float):
+        self._ttl_seconds = ttl_seconds
+        self._refresh_margin_seconds = refresh_margin_seconds
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._pending: Optional[asyncio.Task] = None
+
+    async def get(self) -> str:
+        if self._token is not None and time.monotonic() < self._expires_at - self._refresh_margin_seconds:
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self, rejected_token: Optional[str] = None) -> str:
+        """Retrieve a new access token, unless the rejected token has already been replaced"""
+        if rejected_token is not None and self._token is not None and self._token != rejected_token:
+            return self._token
+
+        if self._pending is None or self._pending.done() or self._pending.get_loop() is not asyncio.get_running_loop():
+            self._pending = asyncio.create_task(self._fetch())
+        return await asyncio.shield(self._pending)
+
+    async def _fetch(self) -> str:
+        print("Retrieving Spotify access token...")
+        token = await _get_access_token_from_browser()
+        self._token = token
+        self._expires_at = time.monotonic() + self._ttl_seconds
+        return token
+
+
+_token_provider: Optional[AccessTokenProvider] = None
+
+
+def get_access_token_provider() -> AccessTokenProvider:
+    global _token_provider
+    if _token_provider is None:
+        _token_provider = AccessTokenProvider(
+            ttl_seconds=configuration.spotify.access_token_ttl_seconds,
+            refresh_margin_seconds=configuration.spotify.access_token_refresh_margin_seconds,
+        )
+    return _token_provider
+
+
+async def get_access_token() -> str:
+    if configuration.spotify.access_token is not None:
+        return configuration.spotify.access_token
+    return await get_access_token_provider().get()
+
+
+async def _get_access_token_from_browser() -> str:
+    # Copied from: https://www.kaggle.com/code/asaniczka/top-spotify-playlist-extractor/notebook
+    url = "https://open.spotify.com/playlist/37i9dQZEVXbNG2KDcFcKOF"
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        page = await browser.new_page()
+
+        async with page.expect_request(
+                re.compile("pathfinder/v1/query")
+        ) as request_info:
+            await page.goto(url)
+
+        res = await request_info.value
+        auth_token = await res.header_value("authorization")
+        return auth_token.replace("Bearer", "").strip()
+
+
+async def batch_spotify_request(
+    ids: list[str],
+    func: Callable[[list[str], str], Awaitable[list[dict]]],
+    batch_size: int,
+    entity_type: str,
+):
+    """Resolve the entities from the persistent cache and request the missing ones in batches"""
+    cache = get_spotify_cache()
+    # SQLite calls block, so they run in a worker thread like the requests
+    cached = await run_in_thread(cache.get_many, entity_type, list(ids)) if cache is not None else {}
+    cached_entities = [entity for entity in cached.values() if entity is not None]
+    missing_ids = [entity_id for entity_id in ids if entity_id not in cached]
+    if len(missing_ids) == 0:
+        return cached_entities
+
+    access_token = await get_access_token()
+    batches = [missing_ids[i:i + batch_size] for i in range(0, len(missing_ids), batch_size)]
+    responses = await asyncio.gather(*(func(batch, access_token) for batch in batches))
+
+    resolved = [
+        r for response in responses
+        for r in response if r is not None
+    ]
+    if cache is not None:
+        await run_in_thread(cache.put_many, entity_type, resolved)
+        # Spotify answers unknown IDs with null at their position
+        await run_in_thread(cache.put_unknown, entity_type, [
+            entity_id for batch, response in zip(batches, responses) if len(response) == len(batch)
+            for entity_id, r in zip(batch, response) if r is None
+        ])
+
+    return cached_entities + resolved
+
+
+async def get_tracks_from_spotify(track_ids: list[str], access_token: str) -> list[dict]:
+    return (await make_spotify_request(
+        "GET",
+        "tracks",
+        {"ids": ",".join(track_ids)},
+        access_token=access_token
+    )).get("tracks", [])
+
+
+async def get_artists_from_spotify(artist_ids: list[str], access_token: str) -> list[dict]:
+    return (await make_spotify_request(
+        "GET",
+        "artists",
+        {"ids": ",".join(artist_ids)},
+        access_token=access_token
+    )).get("artists", [])
+
+
+async def get_audio_features_from_spotify(track_ids: list[str], access_token: str) -> list[dict]:
+    return (await make_spotify_request(
+        "GET",
+        "audio-features",
+        {"ids": ",".join(track_ids)},
+        access_token=access_token
+    )).get("audio_features", [])
+
+
+async def make_spotify_request(method, path, params, access_token) -> dict | list[dict]:
+    return await get_spotify_client().request(method, path, params, access_token)
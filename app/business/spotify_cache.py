@@ -0,0 +1,117 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.models.configuration import configuration
+
+# Expired and least recently used entries are removed at most this often, not on every write
+_EVICT_INTERVAL_SECONDS = 60
+
+
+class SpotifyResponseCache:
+    """
+    Persistent SQLite cache of resolved Spotify entities, keyed by entity type and ID.
+    IDs unknown to Spotify are cached as null payload, so they are not requested again on every import.
+    Entries expire after ttl_seconds (unknown IDs after unknown_ttl_seconds),
+    the least recently used entries are evicted above max_entries. Both are removed periodically while writing.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, unknown_ttl_seconds: float, max_entries: int):
+        self._ttl_seconds = ttl_seconds
+        self._unknown_ttl_seconds = unknown_ttl_seconds
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._evicted_at = 0.0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " entity_type TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (entity_type, id)"
+            ")"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_entities_accessed_at ON entities (accessed_at)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_entities_fetched_at ON entities (fetched_at)")
+        self._connection.commit()
+
+    def get_many(self, entity_type: str, ids: list[str]) -> dict[str, Optional[dict]]:
+        """Cached entities by ID, None for IDs that are known to be unknown to Spotify"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT id, payload FROM entities "
+                    f"WHERE entity_type = ? AND id IN ({','.join('?' * len(batch))}) "
+                    f"AND fetched_at >= (CASE WHEN payload = 'null' THEN ? ELSE ? END)",
+                    [entity_type, *batch, now - self._unknown_ttl_seconds, now - self._ttl_seconds]
+                ).fetchall()
+                found.update({entity_id: json.loads(payload) for entity_id, payload in rows})
+
+            self._connection.executemany(
+                "UPDATE entities SET accessed_at = ? WHERE entity_type = ? AND id = ?",
+                [(now, entity_type, entity_id) for entity_id in found.keys()]
+            )
+            self._connection.commit()
+        return found
+
+    def put_many(self, entity_type: str, entities: list[dict]):
+        self._put(entity_type, [(entity["id"], json.dumps(entity)) for entity in entities])
+
+    def put_unknown(self, entity_type: str, ids: list[str]):
+        self._put(entity_type, [(entity_id, "null") for entity_id in ids])
+
+    def _put(self, entity_type: str, payloads: list[tuple[str, str]]):
+        if len(payloads) == 0:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entities (entity_type, id, payload, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(entity_type, entity_id, payload, now, now) for entity_id, payload in payloads]
+            )
+            if now - self._evicted_at >= _EVICT_INTERVAL_SECONDS:
+                self._evict(now)
+            self._connection.commit()
+
+    def _evict(self, now: float):
+        self._evicted_at = now
+        self._connection.execute("DELETE FROM entities WHERE fetched_at < ?", [now - self._ttl_seconds])
+        self._connection.execute(
+            "DELETE FROM entities WHERE payload = 'null' AND fetched_at < ?", [now - self._unknown_ttl_seconds]
+        )
+        (count,) = self._connection.execute("SELECT count(*) FROM entities").fetchone()
+        if count > self._max_entries:
+            self._connection.execute(
+                "DELETE FROM entities WHERE rowid IN "
+                "(SELECT rowid FROM entities ORDER BY accessed_at LIMIT ?)",
+                [count - self._max_entries]
+            )
+
+
+_cache: Optional[SpotifyResponseCache] = None
+
+
+def get_spotify_cache() -> Optional[SpotifyResponseCache]:
+    global _cache
+    if _cache is None and configuration.spotify.cache_path is not None:
+        _cache = SpotifyResponseCache(
+            path=configuration.spotify.cache_path,
+            ttl_seconds=configuration.spotify.cache_ttl_seconds,
+            unknown_ttl_seconds=configuration.spotify.cache_unknown_ttl_seconds,
+            max_entries=configuration.spotify.cache_max_entries,
+        )
+    return _cache
@@ -4,102 +4,117 @@ from typing import Optional
 from sqlmodel import Session, select
 from sqlalchemy import func
 
-from app.business.utils import add_date_filter
+from app.business.analytics import get_trend_analytics
+from app.business.rollups import trend_scores
+from app.business.utils import hydrate
 from app.database import engine
 from app.models.albums import Album, AlbumPublicWithArtists
 from app.models.artists import Artist
-from app.models.links import TrackArtistLink
+from app.models.exceptions import NotFoundException
 from app.models.tracks import Track, TrackPublicWithAlbumAndArtists
-from app.models.trends import TrendEntry
+from app.models.trends import RollupEntity
 
 
 def get_most_popular_track_per_country(
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
 ) -> dict[str, TrackPublicWithAlbumAndArtists]:
-    statement = (
-        select(
-            TrendEntry.country_code,
-            TrendEntry.track_id,
-            func.sum(51 - TrendEntry.rank).label("total_score"))
-        .group_by(TrendEntry.track_id, TrendEntry.country_code)
-        .order_by(TrendEntry.country_code, func.sum(51 - TrendEntry.rank).desc())
-    )
+    return _first_per_country(get_top_tracks_per_country(1, from_date, to_date))
 
-    statement = add_date_filter(statement, from_date, to_date)
 
-    with Session(engine) as session:
-        res = session.execute(statement).all()
+def get_most_popular_album_per_country(
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> dict[str, AlbumPublicWithArtists]:
+    return _first_per_country(get_top_albums_per_country(1, from_date, to_date))
 
-        country_tracks = {}
 
-        for r in res:
-            if r[0] in country_tracks:
-                continue
-            else:
-                country_tracks[r[0]] = session.get(Track, r[1])
+def get_most_popular_artist_per_country(
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> dict[str, Artist]:
+    return _first_per_country(get_top_artists_per_country(1, from_date, to_date))
+
 
-        return country_tracks  # noqa
+def get_top_tracks_per_country(
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> dict[str, list[TrackPublicWithAlbumAndArtists]]:
+    return _get_top_per_country(Track, RollupEntity.TRACK, top_n, from_date, to_date)
 
 
-def get_most_popular_album_per_country(
+def get_top_albums_per_country(
+        top_n: int,
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
-) -> dict[str, AlbumPublicWithArtists]:
-    statement = (
-        select(
-            TrendEntry.country_code,
-            Track.album_id,
-            func.sum(51 - TrendEntry.rank).label("total_score"))
-        .where(TrendEntry.track_id == Track.id)
-        .group_by(Track.album_id, TrendEntry.country_code)
-        .order_by(TrendEntry.country_code, func.sum(51 - TrendEntry.rank).desc())
-    )
+) -> dict[str, list[AlbumPublicWithArtists]]:
+    return _get_top_per_country(Album, RollupEntity.ALBUM, top_n, from_date, to_date)
 
-    statement = add_date_filter(statement, from_date, to_date)
 
-    with Session(engine) as session:
-        res = session.execute(statement).all()
+def get_top_artists_per_country(
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> dict[str, list[Artist]]:
+    return _get_top_per_country(Artist, RollupEntity.ARTIST, top_n, from_date, to_date)
 
-        country_albums = {}
 
-        for r in res:
-            if r[0] in country_albums:
-                continue
-            else:
-                country_albums[r[0]] = session.get(Album, r[1])
+def _get_top_per_country(
+        model,
+        entity_type: RollupEntity,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+):
+    """Rank the entities within each country, so only the top_n entities per country are loaded"""
+    analytics = get_trend_analytics()
+    with Session(engine) as session:
+        if analytics is not None:
+            top = analytics.top_per_country(entity_type, top_n, from_date, to_date)
+        else:
+            top = _rank_per_country(session, entity_type, top_n, from_date, to_date)
 
-        return country_albums  # noqa
+        entities = hydrate(session, model, (entity_id for entity_ids in top.values() for entity_id in entity_ids))
+        return {
+            country_code: [entities[entity_id] for entity_id in entity_ids] for country_code, entity_ids in top.items()
+        }
 
 
-def get_most_popular_artist_per_country(
+def _rank_per_country(
+        session: Session,
+        entity_type: RollupEntity,
+        top_n: int,
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
-) -> dict[str, Artist]:
-    statement = (
+) -> dict[str, list[str]]:
+    scores = trend_scores(entity_type, from_date, to_date)
+    total_score = func.sum(scores.c.score)
+    ranked = (
         select(
-            TrendEntry.country_code,
-            TrackArtistLink.artist_id,
-            func.sum(51 - TrendEntry.rank).label("total_score"))
-        .where(TrendEntry.track_id == TrackArtistLink.track_id)
-        .group_by(TrackArtistLink.artist_id, TrendEntry.country_code)
-        .order_by(TrendEntry.country_code, func.sum(51 - TrendEntry.rank).desc())
+            scores.c.country_code,
+            scores.c.entity_id,
+            func.row_number().over(
+                partition_by=scores.c.country_code,
+                order_by=(total_score.desc(), scores.c.entity_id.collate("C")),
+            ).label("position"))
+        .group_by(scores.c.entity_id, scores.c.country_code)
+        .subquery()
+    )
+    statement = (
+        select(ranked.c.country_code, ranked.c.entity_id)
+        .where(ranked.c.position <= top_n)
+        .order_by(ranked.c.country_code, ranked.c.position)
     )
 
-    statement = add_date_filter(statement, from_date, to_date)
-
-    with Session(engine) as session:
-        res = session.execute(statement).all()
-
-        country_artists = {}
+    top = {}
+    for r in session.execute(statement).all():
+        top.setdefault(r[0], []).append(r[1])
+    return top
 
-        for r in res:
-            if r[0] in country_artists:
-                continue
-            else:
-                country_artists[r[0]] = session.get(Artist, r[1])
 
-        return country_artists  # noqa
+def _first_per_country(country_entities: dict[str, list]) -> dict:
+    return {country_code: entities[0] for country_code, entities in country_entities.items()}
 
 
 def get_most_popular_track_for_country(
@@ -107,18 +122,7 @@ def get_most_popular_track_for_country(
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
 ) -> TrackPublicWithAlbumAndArtists:
-    with Session(engine) as session:
-        trends = _get_trend_entries(session, country_code, from_date, to_date)
-
-        tracks = {}
-        for trend in trends:
-            ranks = [trend.rank]
-            if trend.track_id in tracks:
-                ranks += tracks[trend.track_id]
-            tracks[trend.track_id] = ranks
-
-        sorted_tracks = sorted(tracks.items(), key=lambda x: _score(x[1], len(trends)), reverse=True)
-        return session.get(Track, sorted_tracks[0][0])  # noqa
+    return get_top_tracks_for_country(country_code, 1, from_date, to_date)[0]
 
 
 def get_most_popular_album_for_country(
@@ -126,18 +130,7 @@ def get_most_popular_album_for_country(
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
 ) -> AlbumPublicWithArtists:
-    with Session(engine) as session:
-        trends = _get_trend_entries(session, country_code, from_date, to_date)
-
-        albums = {}
-        for trend in trends:
-            ranks = [trend.rank]
-            if trend.track.album_id in albums:
-                ranks += albums[trend.track.album_id]
-            albums[trend.track.album_id] = ranks
-
-        sorted_albums = sorted(albums.items(), key=lambda x: _score(x[1], len(trends)), reverse=True)
-        return session.get(Album, sorted_albums[0][0])  # noqa
+    return get_top_albums_for_country(country_code, 1, from_date, to_date)[0]
 
 
 def get_most_popular_artist_for_country(
@@ -145,34 +138,71 @@ def get_most_popular_artist_for_country(
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
 ) -> Artist:
-    with Session(engine) as session:
-        trends = _get_trend_entries(session, country_code, from_date, to_date)
+    return get_top_artists_for_country(country_code, 1, from_date, to_date)[0]
 
-        artists = {}
-        for trend in trends:
 
-            for artist in trend.track.artists:
-                ranks = [trend.rank]
-                if artist.id in artists:
-                    ranks += artists[artist.id]
-                artists[artist.id] = ranks
+def get_top_tracks_for_country(
+        country_code: str,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> list[TrackPublicWithAlbumAndArtists]:
+    return _get_top_for_country(Track, RollupEntity.TRACK, country_code, top_n, from_date, to_date)
+
 
-        sorted_artists = sorted(artists.items(), key=lambda x: _score(x[1], len(trends)), reverse=True)
-        return session.get(Artist, sorted_artists[0][0])  # noqa
+def get_top_albums_for_country(
+        country_code: str,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> list[AlbumPublicWithArtists]:
+    return _get_top_for_country(Album, RollupEntity.ALBUM, country_code, top_n, from_date, to_date)
 
 
-def _get_trend_entries(
-        session: Session,
-        country_code: Optional[str] = None,
+def get_top_artists_for_country(
+        country_code: str,
+        top_n: int,
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
-) -> list[TrendEntry]:
-    statement = select(TrendEntry)
-    if country_code is not None:
-        statement = statement.where(TrendEntry.country_code == country_code)
-    statement = add_date_filter(statement, from_date, to_date)
-    return list(session.exec(statement).all())
+) -> list[Artist]:
+    return _get_top_for_country(Artist, RollupEntity.ARTIST, country_code, top_n, from_date, to_date)
+
+
+def _get_top_for_country(
+        model,
+        entity_type: RollupEntity,
+        country_code: str,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+):
+    analytics = get_trend_analytics()
+    with Session(engine) as session:
+        if analytics is not None:
+            entity_ids = analytics.top_for_country(entity_type, country_code, top_n, from_date, to_date)
+        else:
+            entity_ids = _rank_for_country(session, entity_type, country_code, top_n, from_date, to_date)
 
+        if len(entity_ids) == 0:
+            raise NotFoundException(f"There are no trends for country \"{country_code}\" in the given time range.")
+        entities = hydrate(session, model, entity_ids)
+        return [entities[entity_id] for entity_id in entity_ids]
 
-def _score(ranks: list[int], num_days: int):
-    return (sum([51 - r for r in ranks])) / num_days
+
+def _rank_for_country(
+        session: Session,
+        entity_type: RollupEntity,
+        country_code: str,
+        top_n: int,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+) -> list[str]:
+    scores = trend_scores(entity_type, from_date, to_date)
+    statement = (
+        select(scores.c.entity_id)
+        .where(scores.c.country_code == country_code)
+        .group_by(scores.c.entity_id)
+        .order_by(func.sum(scores.c.score).desc(), scores.c.entity_id.collate("C"))
+        .limit(top_n)
+    )
+    return list(session.exec(statement).all())
@@ -1,9 +1,51 @@
-from app.models.trends import TrendEntry
+import datetime
+from typing import Optional, Iterable
 
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, select
 
-def add_date_filter(statement, from_date, to_date):
+from app.models.albums import Album
+from app.models.tracks import Track
+
+
+def day_bounds(
+    from_date: Optional[datetime.datetime], to_date: Optional[datetime.datetime]
+) -> tuple[Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """
+    First and exclusive last snapshot day (as naive UTC datetimes)
+    that lie within from_date <= date <= to_date
+    """
+    first_day, end_day = None, None
     if from_date is not None:
-        statement = statement.where(TrendEntry.date >= from_date)
+        from_date = _to_naive_utc(from_date)
+        first_day = datetime.datetime.combine(from_date.date(), datetime.time())
+        if first_day < from_date:
+            first_day += datetime.timedelta(days=1)
     if to_date is not None:
-        statement = statement.where(TrendEntry.date <= to_date)
-    return statement
+        end_day = datetime.datetime.combine(_to_naive_utc(to_date).date(), datetime.time()) + datetime.timedelta(days=1)
+    return first_day, end_day
+
+
+def _to_naive_utc(date: datetime.datetime) -> datetime.datetime:
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def hydrate(session: Session, model, ids: Iterable[str]) -> dict:
+    """Load the entities with the given IDs in one query, with the relations needed for their public models"""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) == 0:
+        return {}
+
+    statement = select(model).where(model.id.in_(ids))
+    if model is Track:
+        # Collections are loaded with a second IN query instead of multiplying the joined rows
+        statement = statement.options(
+            joinedload(Track.album).lazyload(Album.artists),
+            selectinload(Track.artists),
+        )
+    elif model is Album:
+        statement = statement.options(selectinload(Album.artists))
+
+    return {entity.id: entity for entity in session.exec(statement).unique().all()}
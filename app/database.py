@@ -1,21 +1,144 @@
-from sqlalchemy import create_engine
-from sqlmodel import SQLModel, Session
+import asyncio
+import contextlib
+import datetime
+import functools
+import threading
+from typing import AsyncIterator, Callable, Optional, TypeVar
+
+import anyio
+from sqlalchemy import create_engine, text, Connection
+from sqlmodel import SQLModel
 
 from app.models.configuration import configuration
 
+T = TypeVar("T")
+
 engine = create_engine(
     f"postgresql+psycopg2://{configuration.postgres.user}:{configuration.postgres.password}"
     f"@{configuration.postgres.host}:{configuration.postgres.port}/"
     f"{configuration.postgres.database_name}",
     echo=False,
-    plugins=["geoalchemy2"]
+    plugins=["geoalchemy2"],
+    pool_size=configuration.postgres.pool_size,
+    max_overflow=configuration.postgres.max_overflow,
+    pool_timeout=configuration.postgres.pool_timeout_seconds,
+    pool_recycle=configuration.postgres.pool_recycle_seconds,
+    pool_pre_ping=True,
 )
 
+_limiter: Optional[anyio.CapacityLimiter] = None
+_process_locks: dict[int, threading.Lock] = {}
+
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        legacy = _rename_unpartitioned_trend_entries(connection)
+        SQLModel.metadata.create_all(connection)
+        if legacy:
+            _migrate_trend_entries(connection)
+
+
+def ensure_trend_partitions(from_date: datetime.datetime, to_date: datetime.datetime, connection: Connection = None):
+    """Create the yearly partitions of trend_entries that are needed for the given dates"""
+    if connection is None:
+        with engine.begin() as connection:
+            return ensure_trend_partitions(from_date, to_date, connection)
+
+    for year in range(from_date.year, to_date.year + 1):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS trend_entries_y{year} PARTITION OF trend_entries "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+
+
+def _rename_unpartitioned_trend_entries(connection: Connection) -> bool:
+    """Move a trend_entries table created before partitioning aside, so it can be copied into the new table"""
+    kind = connection.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = 'trend_entries' AND n.nspname = current_schema()"
+    )).scalar()
+    if kind != "r":
+        return False
+
+    print("Migrating trend entries to a partitioned table...")
+    connection.execute(text("ALTER TABLE trend_entries RENAME TO trend_entries_unpartitioned"))
+    connection.execute(text(
+        "ALTER TABLE trend_entries_unpartitioned RENAME CONSTRAINT trend_entries_pkey TO trend_entries_unpartitioned_pkey"
+    ))
+    return True
+
+
+def _migrate_trend_entries(connection: Connection):
+    from_date, to_date = connection.execute(
+        text("SELECT min(date), max(date) FROM trend_entries_unpartitioned")
+    ).one()
+    if from_date is not None:
+        ensure_trend_partitions(from_date, to_date, connection)
+
+    columns = "date, country_code, rank, daily_movement, weekly_movement, popularity_at_date, track_id"
+    connection.execute(text(
+        f"INSERT INTO trend_entries ({columns}) SELECT {columns} FROM trend_entries_unpartitioned"
+    ))
+    connection.execute(text("DROP TABLE trend_entries_unpartitioned"))
+
+
+async def run_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run blocking database work in a worker thread, so it does not block the event loop.
+    At most as many calls run at once as the connection pool can serve.
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(
+            configuration.postgres.max_concurrent_queries
+            or configuration.postgres.pool_size + configuration.postgres.max_overflow
+        )
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter)
+
+
+async def run_in_thread(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Like asyncio.to_thread, but if the caller is cancelled the CancelledError is only raised once the thread has
+    finished, so nothing the thread still uses (files, connections) is cleaned up underneath it.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Threads cannot be interrupted
+        while not future.done():
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                pass
+        raise
+
 
+@contextlib.asynccontextmanager
+async def advisory_lock(key: int, poll_seconds: float = 1) -> AsyncIterator[None]:
+    """
+    Hold a PostgreSQL advisory lock, so the guarded work runs only once at a time across all processes.
+    Callers of the same process first wait for a lock of the process, so only one of them holds a pooled
+    connection while waiting for the advisory lock.
+    """
+    process_lock = _process_locks.setdefault(key, threading.Lock())
+    while not process_lock.acquire(blocking=False):
+        await asyncio.sleep(poll_seconds)
 
-def session_producer():
-    with Session(engine) as session:
-        yield session
+    try:
+        connection = await run_in_thread(engine.connect)
+        try:
+            connection.execution_options(isolation_level="AUTOCOMMIT")
+            while not await run_in_thread(
+                lambda: connection.execute(text("SELECT pg_try_advisory_lock(:key)"), dict(key=key)).scalar()
+            ):
+                await asyncio.sleep(poll_seconds)
+            yield
+        finally:
+            try:
+                # Also releases the lock if it was acquired by an attempt that has been cancelled
+                await run_in_thread(connection.execute, text("SELECT pg_advisory_unlock_all()"))
+            finally:
+                await run_in_thread(connection.close)
+    finally:
+        process_lock.release()
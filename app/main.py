@@ -11,6 +11,9 @@ from asyncio import run
 from app.api import root, data_import, trends, popularity, maps, artists, albums, tracks
 from app.database import create_db_and_tables
 from app.business.data_import import import_songs_from_kaggle, import_countries
+from app.business.analytics import load_trend_analytics
+from app.business.dataset_metadata import refresh_dataset_metadata
+from app.business.rollups import backfill_trend_rollups
 from app.models.exceptions import NotFoundException
 
 app = FastAPI(
@@ -52,6 +55,9 @@ app.mount("", StaticFiles(directory="static", html=True), name="static")
 
 create_db_and_tables()
 import_countries()
+backfill_trend_rollups()
+refresh_dataset_metadata()
+load_trend_analytics()
 
 scheduler = BackgroundScheduler()
 scheduler.start()
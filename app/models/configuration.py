@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
@@ -8,10 +10,62 @@ class _PostGresSettings(BaseModel):
     host: str
     port: int
     database_name: str
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout_seconds: float = 30
+    pool_recycle_seconds: int = 1800
+    # Maximum number of blocking database calls running in worker threads (defaults to pool_size + max_overflow)
+    max_concurrent_queries: Optional[int] = None
+
+
+class _DataImportSettings(BaseModel):
+    csv_chunk_size: int = 100_000
+    # Maximum number of days buffered between the stages of the import pipeline
+    pipeline_queue_size: int = 8
+    # Number of new tracks collected before their metadata is resolved
+    resolve_batch_size: int = 1_000
+
+
+class _SpotifySettings(BaseModel):
+    api_url: str = "https://api.spotify.com/v1/"
+    # Static access token, e.g. for a mock server (otherwise retrieved using a headless browser)
+    access_token: Optional[str] = None
+    access_token_ttl_seconds: float = 3600
+    access_token_refresh_margin_seconds: float = 300
+    max_concurrent_requests: int = 8
+    max_retries: int = 5
+    retry_backoff_seconds: float = 10
+    # Upper bound of the wait requested by a Retry-After header
+    max_retry_after_seconds: float = 300
+    timeout_seconds: float = 30
+    # Persistent cache of resolved tracks, artists and audio features (disabled if not set)
+    cache_path: Optional[str] = "spotify-cache/spotify.sqlite3"
+    cache_ttl_seconds: float = 90 * 24 * 60 * 60
+    # IDs that Spotify does not know (anymore) are requested again after this time
+    cache_unknown_ttl_seconds: float = 7 * 24 * 60 * 60
+    cache_max_entries: int = 1_000_000
+
+
+class _AnalyticsSettings(BaseModel):
+    # Answer trend and popularity queries from an in-memory copy of the trend entries instead of the database
+    in_memory: bool = False
+
+
+class _ResponseCacheSettings(BaseModel):
+    enabled: bool = True
+    max_memory_bytes: int = 64 * 1024 * 1024
+    # SQLite file shared by all workers of a host (only the in-memory cache is used if not set)
+    shared_path: Optional[str] = None
+    # How long the data generation read from the database is trusted before it is read again
+    generation_check_seconds: float = 10
 
 
 class Configuration(BaseSettings):
     postgres: _PostGresSettings
+    data_import: _DataImportSettings = _DataImportSettings()
+    spotify: _SpotifySettings = _SpotifySettings()
+    analytics: _AnalyticsSettings = _AnalyticsSettings()
+    response_cache: _ResponseCacheSettings = _ResponseCacheSettings()
 
     class Config:
         env_nested_delimiter = '__'
@@ -1,12 +1,29 @@
+import enum
 from typing import Any
 
 from geoalchemy2 import Geometry
 from sqlmodel import SQLModel, Field, Column
 
 
+class GeometryDetail(str, enum.Enum):
+    FULL = "full"
+    HIGH = "high"
+    MEDIUM = "medium"
+    LOW = "low"
+
+
 class Country(SQLModel, table=True):
     __tablename__ = "countries"
     alpha_2_code: str = Field(primary_key=True)
 
     name: str
     polygon: Any = Field(sa_column=Column(Geometry(geometry_type='MULTIPOLYGON'), nullable=False))
+
+
+class CountryGeometry(SQLModel, table=True):
+    """Pre-simplified polygon of a country for a specific level of detail"""
+    __tablename__ = "country_geometries"
+
+    alpha_2_code: str = Field(foreign_key="countries.alpha_2_code", primary_key=True)
+    detail: GeometryDetail = Field(primary_key=True)
+    polygon: Any = Field(sa_column=Column(Geometry(geometry_type='MULTIPOLYGON'), nullable=False))
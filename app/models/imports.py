@@ -0,0 +1,154 @@
+import datetime
+import enum
+from typing import Optional
+
+from pydantic import BaseModel, computed_field
+from sqlmodel import SQLModel, Field
+
+
+class ImportedFile(SQLModel, table=True):
+    __tablename__ = "imported_files"
+
+    name: str = Field(primary_key=True)
+    size: int
+    header_checksum: str
+    imported_at: datetime.datetime
+
+
+class DatasetVersion(SQLModel, table=True):
+    """Checksum of the last imported version of a static dataset"""
+    __tablename__ = "dataset_versions"
+
+    name: str = Field(primary_key=True)
+    checksum: str
+    imported_at: datetime.datetime
+
+
+class DataGeneration(SQLModel, table=True):
+    """Counter that is increased whenever imported data changes, used to invalidate cached results"""
+    __tablename__ = "data_generations"
+
+    name: str = Field(primary_key=True)
+    generation: int
+    updated_at: datetime.datetime
+
+
+class ImportManifestEntry(SQLModel, table=True):
+    __tablename__ = "import_manifest"
+
+    file_name: str = Field(foreign_key="imported_files.name", primary_key=True)
+    snapshot_date: datetime.datetime = Field(primary_key=True)
+
+    byte_offset: int
+    byte_length: int
+    row_count: int
+    checksum: str
+
+
+class ImportRunStatus(str, enum.Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ImportRun(SQLModel, table=True):
+    __tablename__ = "import_runs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    source: str = Field(index=True)
+    status: ImportRunStatus
+    started_at: datetime.datetime
+    finished_at: Optional[datetime.datetime] = None
+
+
+class CheckpointStage(str, enum.Enum):
+    METADATA = "metadata"
+    TRENDS = "trends"
+
+
+class ImportCheckpoint(SQLModel, table=True):
+    __tablename__ = "import_checkpoints"
+
+    run_id: int = Field(foreign_key="import_runs.id", primary_key=True)
+    snapshot_date: datetime.datetime = Field(primary_key=True)
+    stage: CheckpointStage = Field(primary_key=True)
+
+    row_count: int
+    created_at: datetime.datetime
+
+
+class ImportStage(str, enum.Enum):
+    QUEUED = "queued"
+    PARSING = "parsing"
+    IMPORTING = "importing"
+    FINISHED = "finished"
+
+
+class ImportStageStats(BaseModel):
+    """Throughput of a stage of the import pipeline"""
+    name: str
+    days: int = 0
+    rows: int = 0
+    busy_seconds: float = 0.0
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+
+class ImportProgress(BaseModel):
+    stage: ImportStage = ImportStage.QUEUED
+    days_processed: int = 0
+    rows_processed: int = 0
+    started_at: Optional[datetime.datetime] = None
+    updated_at: Optional[datetime.datetime] = None
+    stage_stats: list[ImportStageStats] = []
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> float:
+        if self.started_at is None or self.updated_at is None:
+            return 0.0
+        elapsed = (self.updated_at - self.started_at).total_seconds()
+        return self.rows_processed / elapsed if elapsed > 0 else 0.0
+
+    def set_stage(self, stage: "ImportStage"):
+        now = datetime.datetime.now()
+        self.started_at = self.started_at or now
+        self.updated_at = now
+        self.stage = stage
+
+    def add_day(self, rows: int):
+        self.days_processed += 1
+        self.rows_processed += rows
+        self.updated_at = datetime.datetime.now()
+
+
+class ImportJobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class ImportJob(BaseModel):
+    id: str
+    file_name: str
+    status: ImportJobStatus = ImportJobStatus.QUEUED
+    progress: ImportProgress = ImportProgress()
+    message: Optional[str] = None
+    created_at: datetime.datetime
+    finished_at: Optional[datetime.datetime] = None
+
+
+class DatasetMetadata(BaseModel):
+    generation: int
+    from_date: Optional[datetime.datetime] = None
+    to_date: Optional[datetime.datetime] = None
+    trend_entry_count: int = 0
+    track_count: int = 0
+    album_count: int = 0
+    artist_count: int = 0
+    country_codes: list[str] = []
@@ -1,5 +1,7 @@
 import datetime
+import enum
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 from app.models.tracks import Track
@@ -7,6 +9,13 @@ from app.models.tracks import Track
 
 class TrendEntry(SQLModel, table=True):
     __tablename__ = 'trend_entries'
+    __table_args__ = (
+        # Partitions per year are created when entries are written (see app.database.ensure_trend_partitions)
+        Index("ix_trend_entries_track_country_date", "track_id", "country_code", "date"),
+        Index("ix_trend_entries_country_date", "country_code", "date"),
+        Index("ix_trend_entries_date_brin", "date", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
     date: datetime.datetime = Field(primary_key=True)
     country_code: str = Field(primary_key=True)
@@ -20,3 +29,29 @@ class TrendEntry(SQLModel, table=True):
     track_id: str = Field(foreign_key="tracks.id")
     track: Track = Relationship(back_populates="trend_entries")
 
+
+class RollupEntity(str, enum.Enum):
+    TRACK = "track"
+    ALBUM = "album"
+    ARTIST = "artist"
+
+
+class RollupGranularity(str, enum.Enum):
+    WEEK = "week"
+    MONTH = "month"
+
+
+class TrendRollup(SQLModel, table=True):
+    """Summed score (51 - rank) of an entity in a country over a week or month"""
+    __tablename__ = 'trend_rollups'
+    __table_args__ = (
+        Index("ix_trend_rollups_entity", "entity_type", "entity_id", "granularity", "period_start"),
+    )
+
+    entity_type: RollupEntity = Field(primary_key=True)
+    granularity: RollupGranularity = Field(primary_key=True)
+    period_start: datetime.datetime = Field(primary_key=True)
+    country_code: str = Field(primary_key=True)
+    entity_id: str = Field(primary_key=True)
+
+    score: int
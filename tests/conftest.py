@@ -0,0 +1,5 @@
+import os
+
+# The configuration is read on import, the database engine is created without connecting to it
+for key, value in dict(USER="postgres", PASSWORD="postgres", HOST="localhost", PORT="5432", DATABASE_NAME="postgres").items():
+    os.environ.setdefault(f"POSTGRES__{key}", value)
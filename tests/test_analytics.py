@@ -0,0 +1,135 @@
+import datetime
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from app.business.analytics import TrendAnalytics
+from app.models.trends import RollupEntity
+
+EPOCH = datetime.datetime(1970, 1, 1)
+FIRST_DAY = 19_720
+
+COUNTRIES = ["US", "DE", "ZZ", "AT"]
+# Mixed case IDs, the C collation orders upper case before lower case
+TRACKS = ["t3", "T9", "t10", "a1", "t2", "B7"]
+ALBUMS = ["x", "X", "b"]
+ARTISTS = ["r2", "R1", "r10", "q"]
+TRACK_ALBUM = [0, 1, 0, 2, 1, 0]
+TRACK_ARTISTS = [[0], [1, 2], [0, 3], [], [2], [3, 1]]
+
+
+@pytest.fixture(scope="module")
+def entries():
+    rng = np.random.default_rng(11)
+    rows = []
+    for day in range(FIRST_DAY, FIRST_DAY + 20):
+        for country in range(len(COUNTRIES) - 1):
+            # Few high ranks, so equal scores are frequent
+            for rank, track in zip(rng.choice(np.arange(46, 51), 3, replace=False), rng.permutation(len(TRACKS))):
+                rows.append((day, country, rank, track))
+    # Two tracks with the same entries, so their scores tie everywhere
+    rows += [(FIRST_DAY + 3, 3, 1, 0), (FIRST_DAY + 3, 3, 2, 4), (FIRST_DAY + 4, 3, 1, 4), (FIRST_DAY + 4, 3, 2, 0)]
+    return rows
+
+
+@pytest.fixture(scope="module")
+def analytics(entries):
+    day, country, rank, track = (np.array(values) for values in zip(*entries))
+    artist_offsets = np.cumsum([0] + [len(artists) for artists in TRACK_ARTISTS])
+    return TrendAnalytics(
+        generation=1,
+        checkpoints={},
+        countries=COUNTRIES,
+        entity_ids={RollupEntity.TRACK: TRACKS, RollupEntity.ALBUM: ALBUMS, RollupEntity.ARTIST: ARTISTS},
+        day=day.astype(np.uint16),
+        country=country.astype(np.int16),
+        rank=rank.astype(np.uint8),
+        track=track.astype(np.int32),
+        track_album=np.array(TRACK_ALBUM, np.int32),
+        artist_offsets=artist_offsets,
+        artist_links=np.array([artist for artists in TRACK_ARTISTS for artist in artists], np.int32),
+    )
+
+
+def reference_scores(entries, entity_type, from_date, to_date) -> dict[str, dict[str, int]]:
+    """Summed scores per country and entity like the SQL path: from_date <= date <= to_date, 51 - rank"""
+    from_date, to_date = (
+        None if date is None else date.astimezone(datetime.timezone.utc).replace(tzinfo=None) if date.tzinfo else date
+        for date in (from_date, to_date)
+    )
+    scores = defaultdict(lambda: defaultdict(int))
+    for day, country, rank, track in entries:
+        date = EPOCH + datetime.timedelta(days=day)
+        if (from_date is not None and date < from_date) or (to_date is not None and date > to_date):
+            continue
+        entities = {
+            RollupEntity.TRACK: [TRACKS[track]],
+            RollupEntity.ALBUM: [ALBUMS[TRACK_ALBUM[track]]],
+            RollupEntity.ARTIST: [ARTISTS[artist] for artist in TRACK_ARTISTS[track]],
+        }[entity_type]
+        for entity in entities:
+            scores[COUNTRIES[country]][entity] += 51 - rank
+    return scores
+
+
+def ranked(scores: dict[str, int], top_n: int) -> list[str]:
+    # Score descending, then entity ID in C collation (code point order)
+    return sorted(scores, key=lambda entity: (-scores[entity], entity))[:top_n]
+
+
+def day(offset: int, hour: int = 0) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(days=FIRST_DAY + offset, hours=hour)
+
+
+RANGES = [
+    (None, None),
+    (day(0), day(19)),
+    (day(2, 10), day(9, 5)),
+    (day(5), None),
+    (None, day(4, 23)),
+    (day(3), day(3)),
+    (day(3, 12), day(3, 6)),
+    (day(-30), day(60)),
+    (day(6).replace(tzinfo=datetime.timezone(datetime.timedelta(hours=2))), day(11, 1)),
+]
+
+
+@pytest.mark.parametrize("entity_type", list(RollupEntity))
+@pytest.mark.parametrize("from_date, to_date", RANGES)
+def test_top_per_country_equals_sql_semantics(analytics, entries, entity_type, from_date, to_date):
+    scores = reference_scores(entries, entity_type, from_date, to_date)
+    for top_n in [1, 2, 10]:
+        expected = {country: ranked(scores[country], top_n) for country in sorted(scores)}
+        top = analytics.top_per_country(entity_type, top_n, from_date, to_date)
+        # Ordered by country code like the query
+        assert list(top.items()) == list(expected.items())
+
+
+@pytest.mark.parametrize("entity_type", list(RollupEntity))
+@pytest.mark.parametrize("from_date, to_date", RANGES)
+def test_top_for_country_equals_sql_semantics(analytics, entries, entity_type, from_date, to_date):
+    scores = reference_scores(entries, entity_type, from_date, to_date)
+    for country in [*COUNTRIES, "FR"]:
+        for top_n in [1, 3, 10]:
+            expected = ranked(scores.get(country, {}), top_n)
+            assert analytics.top_for_country(entity_type, country, top_n, from_date, to_date) == expected
+
+
+@pytest.mark.parametrize("entity_type, entity_ids", [
+    (RollupEntity.TRACK, [*TRACKS, "t404"]),
+    (RollupEntity.ALBUM, [*ALBUMS, "y"]),
+    (RollupEntity.ARTIST, [*ARTISTS, "r404"]),
+])
+@pytest.mark.parametrize("from_date, to_date", RANGES)
+def test_popularity_equals_sql_semantics(analytics, entries, entity_type, entity_ids, from_date, to_date):
+    scores = reference_scores(entries, entity_type, from_date, to_date)
+    for entity_id in entity_ids:
+        country_scores = {country: scores[country][entity_id] for country in scores if entity_id in scores[country]}
+        max_score = max(country_scores.values(), default=1)
+        expected = {country: score / max_score for country, score in country_scores.items()}
+        assert analytics.popularity(entity_type, entity_id, from_date, to_date) == expected
+
+
+def test_tied_tracks_are_ordered_by_id(analytics):
+    assert analytics.top_for_country(RollupEntity.TRACK, "AT", 2) == ["t2", "t3"]
@@ -0,0 +1,40 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.business.data_import import read_songs_csv_days
+from app.models.configuration import configuration
+
+HEADER = "spotify_id,name,daily_rank,daily_movement,weekly_movement,country,snapshot_date,popularity\n"
+
+
+def csv(dates: list[str]) -> io.StringIO:
+    lines = [
+        f"t{rank},\"a, b\",{rank},0,-1,{country},{date},50\n"
+        for date in dates for country in ["DE", "", "US"] for rank in range(1, 4)
+    ]
+    return io.StringIO(HEADER + "".join(lines))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 100])
+def test_days_are_yielded_in_file_order_across_chunks(monkeypatch, chunk_size):
+    monkeypatch.setattr(configuration.data_import, "csv_chunk_size", chunk_size)
+
+    days = list(read_songs_csv_days(csv(["2024-01-03", "2024-01-02", "2024-01-01"])))
+
+    assert [str(date.date()) for date, _ in days] == ["2024-01-03", "2024-01-02", "2024-01-01"]
+    for date, df in days:
+        # Global entries are dropped, every day is complete
+        assert len(df) == 6
+        assert (df["snapshot_date"] == date).all()
+        assert sorted(df["country"].unique()) == ["DE", "US"]
+        assert df["spotify_id"].dtype == "category"
+
+
+def test_days_up_to_min_date_are_skipped(monkeypatch):
+    monkeypatch.setattr(configuration.data_import, "csv_chunk_size", 5)
+
+    days = list(read_songs_csv_days(csv(["2024-01-03", "2024-01-02", "2024-01-01"]), pd.Timestamp("2024-01-02")))
+
+    assert [str(date.date()) for date, _ in days] == ["2024-01-03"]
@@ -0,0 +1,138 @@
+import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from app.business.import_manifest import CsvImportPlan, _plan, _update_entries, _imported_file, open_csv_range
+
+HEADER = "spotify_id,name,daily_rank,country,snapshot_date\n"
+
+
+def rows(dates: list[str], name: str = "a, b") -> str:
+    return "".join(
+        f"t{rank},\"{name}\",{rank},{country},{date}\n"
+        for date in dates for country in ["DE", "US"] for rank in range(1, 4)
+    )
+
+
+class Manifest:
+    """In-memory stand-in for the manifest tables of one file"""
+
+    def __init__(self, path: Path):
+        self.path = str(path)
+        self.imported_file = None
+        self.entries = {}
+
+    def plan(self) -> CsvImportPlan:
+        entries = sorted(self.entries.values(), key=lambda entry: entry.byte_offset)
+        return _plan(self.path, "songs.csv", self.imported_file, entries)
+
+    def record(self, plan: CsvImportPlan) -> bool:
+        if plan.reset:
+            self.entries = {}
+        valid = _update_entries(self.path, plan, self.entries)
+        self.imported_file = _imported_file(self.path, "songs.csv") if valid else None
+        return valid
+
+    def import_file(self) -> list[str]:
+        """Plan and record an import, returns the parsed snapshot dates"""
+        plan = self.plan()
+        with open_csv_range(self.path, plan) as source:
+            dates = sorted(pd.read_csv(source)["snapshot_date"].unique().tolist())
+        self.record(plan)
+        return dates
+
+
+def test_first_import_parses_whole_file(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01", "2024-01-02"]))
+    manifest = Manifest(path)
+
+    plan = manifest.plan()
+    assert plan.reset
+    assert (plan.start, plan.end) == (len(HEADER), path.stat().st_size)
+    assert manifest.import_file() == ["2024-01-01", "2024-01-02"]
+    assert manifest.entries[datetime.datetime(2024, 1, 1)].row_count == 6
+
+
+def test_unchanged_file_is_skipped(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01", "2024-01-02"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+
+    assert manifest.plan().is_empty
+
+
+def test_appended_rows_are_detected(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01", "2024-01-02"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+    size = path.stat().st_size
+
+    path.write_text(HEADER + rows(["2024-01-01", "2024-01-02", "2024-01-03"]))
+    plan = manifest.plan()
+    assert not plan.reset
+    assert (plan.start, plan.end, plan.shift) == (size, path.stat().st_size, 0)
+    assert manifest.import_file() == ["2024-01-03"]
+    assert manifest.plan().is_empty
+
+
+def test_prepended_rows_are_detected(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-02", "2024-01-01"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+
+    path.write_text(HEADER + rows(["2024-01-04", "2024-01-03", "2024-01-02", "2024-01-01"]))
+    plan = manifest.plan()
+    assert not plan.reset
+    assert plan.shift == len(rows(["2024-01-04", "2024-01-03"]))
+    assert (plan.start, plan.end) == (len(HEADER), len(HEADER) + plan.shift)
+    assert manifest.import_file() == ["2024-01-03", "2024-01-04"]
+
+    # The previously imported segments have been moved by the prepended rows
+    assert manifest.entries[datetime.datetime(2024, 1, 1)].byte_offset == len(HEADER + rows(["2024-01-04"] * 3))
+    assert manifest.plan().is_empty
+
+
+def test_continued_last_day_is_merged(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+
+    path.write_text(HEADER + rows(["2024-01-01"]) + rows(["2024-01-01"]))
+    assert manifest.import_file() == ["2024-01-01"]
+    assert len(manifest.entries) == 1
+    assert manifest.entries[datetime.datetime(2024, 1, 1)].row_count == 12
+
+
+def test_changed_rows_in_the_middle_lead_to_full_import(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01"]) + rows(["2024-01-02"]) + rows(["2024-01-03"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+
+    path.write_text(HEADER + rows(["2024-01-01"]) + rows(["2024-01-02"], name="changed") + rows(["2024-01-03"]))
+    assert manifest.plan().reset
+
+
+def test_changed_header_leads_to_full_import(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01"]))
+    manifest = Manifest(path)
+    manifest.import_file()
+
+    path.write_text(HEADER.replace("name", "title") + rows(["2024-01-01"]))
+    assert manifest.plan().reset
+
+
+def test_dates_that_are_not_contiguous_invalidate_the_manifest(tmp_path: Path):
+    path = tmp_path / "songs.csv"
+    path.write_text(HEADER + rows(["2024-01-01", "2024-01-02", "2024-01-01"]))
+    manifest = Manifest(path)
+
+    assert not manifest.record(manifest.plan())
+    assert manifest.plan().reset
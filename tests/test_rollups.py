@@ -0,0 +1,88 @@
+import datetime
+import random
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.business.rollups import _plan_range, _period_start, trend_scores
+from app.models.trends import RollupEntity, RollupGranularity
+
+MONTH, WEEK = RollupGranularity.MONTH, RollupGranularity.WEEK
+
+
+def day(month: int, day_of_month: int) -> datetime.datetime:
+    return datetime.datetime(2024, month, day_of_month)
+
+
+def test_plan_range_without_bounds_uses_all_months():
+    assert _plan_range(None, None) == [(MONTH, None, None)]
+
+
+def test_plan_range_within_a_week_reads_days():
+    assert _plan_range(day(1, 10), day(1, 12)) == [(None, day(1, 10), day(1, 12))]
+
+
+def test_plan_range_of_full_month():
+    assert _plan_range(day(1, 1), day(2, 1)) == [(MONTH, day(1, 1), day(2, 1))]
+
+
+def test_plan_range_splits_edges_into_weeks_and_days():
+    # 2024-01-08 and 2024-03-04 are Mondays
+    assert _plan_range(day(1, 3), day(3, 20)) == [
+        (MONTH, day(2, 1), day(3, 1)),
+        (WEEK, day(1, 8), day(1, 29)),
+        (None, day(1, 3), day(1, 8)),
+        (None, day(1, 29), day(2, 1)),
+        (WEEK, day(3, 4), day(3, 18)),
+        (None, day(3, 1), day(3, 4)),
+        (None, day(3, 18), day(3, 20)),
+    ]
+
+
+def test_plan_range_with_open_end():
+    assert _plan_range(day(1, 29), None) == [
+        (MONTH, day(2, 1), None),
+        (None, day(1, 29), day(2, 1)),
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_range_covers_every_day_once(seed: int):
+    rng = random.Random(seed)
+    for _ in range(50):
+        first_day = day(1, 1) + datetime.timedelta(days=rng.randrange(400))
+        end_day = first_day + datetime.timedelta(days=rng.randrange(1, 200))
+
+        covered = []
+        for granularity, lower, upper in _plan_range(first_day, end_day):
+            if granularity is not None:
+                # Rollups can only be used for whole periods
+                assert _period_start(granularity, lower) == lower
+                assert _period_start(granularity, upper) == upper
+            covered += [lower + datetime.timedelta(days=i) for i in range((upper - lower).days)]
+
+        assert sorted(covered) == [first_day + datetime.timedelta(days=i) for i in range((end_day - first_day).days)]
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_trend_scores_of_full_months_only_read_rollups():
+    sql = compile_sql(trend_scores(RollupEntity.TRACK, day(1, 1), day(2, 29)))
+    assert "trend_rollups" in sql
+    assert "trend_entries" not in sql
+    assert "UNION ALL" not in sql
+
+
+def test_trend_scores_combines_rollups_and_edge_days():
+    sql = compile_sql(trend_scores(RollupEntity.ARTIST, day(1, 3), day(3, 19)))
+    assert sql.count("UNION ALL") == 6
+    assert sql.count("FROM trend_rollups") == 3
+    assert sql.count("FROM trend_entries JOIN trackartistlink") == 4
+
+
+def test_trend_scores_of_range_without_a_whole_day():
+    sql = compile_sql(trend_scores(RollupEntity.ALBUM, day(1, 3) + datetime.timedelta(hours=10), day(1, 3)))
+    assert "trend_rollups" not in sql
+    assert "FROM trend_entries JOIN tracks" in sql
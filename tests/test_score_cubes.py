@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from app.business.score_cubes import ScoreCube
+
+
+@pytest.fixture
+def scores():
+    rng = np.random.default_rng(7)
+    size = 2_000
+    return (
+        rng.integers(0, 4, size),
+        # Entities use the whole 32 bits
+        rng.choice(np.array([0, 1, 5, 2 ** 31, 2 ** 32 - 1]), size),
+        rng.integers(19_000, 19_100, size),
+        rng.integers(1, 51, size),
+    )
+
+
+def brute_force(scores, first_day, end_day, country=None, entity=None) -> dict[tuple[int, int], int]:
+    totals = defaultdict(int)
+    for c, e, d, s in zip(*(values.tolist() for values in scores)):
+        if (
+            (first_day is None or d >= first_day) and (end_day is None or d < end_day)
+            and country in (None, c) and entity in (None, e)
+        ):
+            totals[(c, e)] += s
+    return dict(totals)
+
+
+def as_dict(result) -> dict[tuple[int, int], int]:
+    countries, entities, totals = result
+    return {(c, e): s for c, e, s in zip(countries.tolist(), entities.tolist(), totals.tolist())}
+
+
+@pytest.mark.parametrize("first_day, end_day", [
+    (None, None), (19_000, 19_100), (19_010, 19_011), (19_050, None), (None, 19_020), (19_040, 19_030), (0, 70_000),
+])
+def test_range_scores_equal_brute_force(scores, first_day, end_day):
+    cube = ScoreCube.empty().extended(*scores)
+
+    assert as_dict(cube.range_scores(first_day, end_day)) == brute_force(scores, first_day, end_day)
+    for country in [0, 3, 9]:
+        assert as_dict(cube.range_scores(first_day, end_day, country=country)) == \
+            brute_force(scores, first_day, end_day, country=country)
+    for entity in [1, 2 ** 32 - 1, 2]:
+        assert as_dict(cube.range_scores(first_day, end_day, entity=entity)) == \
+            brute_force(scores, first_day, end_day, entity=entity)
+
+
+def test_extending_equals_building_at_once(scores):
+    # The parts share keys, add new pairs and insert days before existing ones
+    extended = ScoreCube.empty()
+    for start, end in [(0, 1_000), (1_000, 1_000), (1_000, 1_001), (1_001, 2_000)]:
+        extended = extended.extended(*(values[start:end] for values in scores))
+    built = ScoreCube.empty().extended(*scores)
+
+    assert np.array_equal(extended.keys, built.keys)
+    assert np.array_equal(extended.prefix, built.prefix)
+    assert np.array_equal(extended.pairs, built.pairs)
+
+
+@pytest.mark.parametrize("countries, entities, days", [
+    ([256], [0], [0]),
+    ([-1], [0], [0]),
+    ([0], [2 ** 32], [0]),
+    ([0], [-1], [0]),
+    ([0], [0], [65_536]),
+    ([0], [0], [-1]),
+])
+def test_values_outside_of_the_key_bits_are_rejected(countries, entities, days):
+    with pytest.raises(ValueError):
+        ScoreCube.empty().extended(np.array(countries), np.array(entities), np.array(days), np.array([1]))
@@ -0,0 +1,106 @@
+"""
+Local mock of the Spotify Web API endpoints used by the import, to measure the import throughput offline.
+
+Run it with ``uvicorn tools.mock_spotify_server:app --port 8081`` and start the app with
+``SPOTIFY__API_URL=http://localhost:8081/v1/`` and ``SPOTIFY__ACCESS_TOKEN=mock``.
+
+The responses are generated deterministically from the requested IDs. The simulated latency
+and the share of rate limited responses can be set with ``MOCK_SPOTIFY_LATENCY_MS`` and
+``MOCK_SPOTIFY_RATE_LIMIT_RATIO``.
+"""
+import asyncio
+import hashlib
+import os
+import random
+
+from fastapi import FastAPI, Query
+from starlette.responses import JSONResponse
+
+LATENCY_MS = float(os.environ.get("MOCK_SPOTIFY_LATENCY_MS", "150"))
+RATE_LIMIT_RATIO = float(os.environ.get("MOCK_SPOTIFY_RATE_LIMIT_RATIO", "0"))
+
+app = FastAPI(title="Mock Spotify Web API")
+
+
+def _number(value: str, modulo: int) -> int:
+    return int(hashlib.sha1(value.encode()).hexdigest(), 16) % modulo
+
+
+def _urls(kind: str, entity_id: str) -> dict:
+    return {"spotify": f"https://open.spotify.com/{kind}/{entity_id}"}
+
+
+def _artist_stub(artist_id: str) -> dict:
+    return {"id": artist_id, "name": f"Artist {artist_id}", "external_urls": _urls("artist", artist_id)}
+
+
+def _album(album_id: str) -> dict:
+    return {
+        "id": album_id,
+        "name": f"Album {album_id}",
+        "album_type": "album",
+        "total_tracks": 1 + _number(album_id, 20),
+        "images": [],
+        "external_urls": _urls("album", album_id),
+        "artists": [_artist_stub(f"artist{_number(album_id, 5000)}")],
+    }
+
+
+def _track(track_id: str) -> dict:
+    return {
+        "id": track_id,
+        "name": f"Track {track_id}",
+        "preview_url": None,
+        "explicit": _number(track_id, 2) == 1,
+        "duration_ms": 120_000 + _number(track_id, 120_000),
+        "external_urls": _urls("track", track_id),
+        "album": _album(f"album{_number(track_id, 20000)}"),
+        "artists": [_artist_stub(f"artist{_number(track_id + str(i), 5000)}") for i in range(1 + _number(track_id, 3))],
+    }
+
+
+def _artist(artist_id: str) -> dict:
+    return {**_artist_stub(artist_id), "images": [], "genres": ["pop"]}
+
+
+def _audio_features(track_id: str) -> dict:
+    return {
+        "id": track_id,
+        "type": "audio_features",
+        "uri": f"spotify:track:{track_id}",
+        "duration_ms": 120_000 + _number(track_id, 120_000),
+        "danceability": _number(track_id + "d", 1000) / 1000,
+        "energy": _number(track_id + "e", 1000) / 1000,
+        "key": _number(track_id, 12),
+        "loudness": -_number(track_id + "l", 60),
+        "speechiness": _number(track_id + "s", 1000) / 1000,
+        "acousticness": _number(track_id + "a", 1000) / 1000,
+        "instrumentalness": _number(track_id + "i", 1000) / 1000,
+        "valence": _number(track_id + "v", 1000) / 1000,
+        "tempo": 60 + _number(track_id, 120),
+        "liveness": _number(track_id + "v", 1000) / 1000,
+        "mode": _number(track_id, 2),
+        "time_signature": 4,
+    }
+
+
+async def _respond(key: str, ids: str, factory) -> JSONResponse:
+    await asyncio.sleep(LATENCY_MS / 1000)
+    if random.random() < RATE_LIMIT_RATIO:
+        return JSONResponse(status_code=429, headers={"Retry-After": "1"}, content={"error": "rate limited"})
+    return JSONResponse({key: [factory(entity_id) for entity_id in ids.split(",") if entity_id]})
+
+
+@app.get("/v1/tracks")
+async def get_tracks(ids: str = Query()):
+    return await _respond("tracks", ids, _track)
+
+
+@app.get("/v1/artists")
+async def get_artists(ids: str = Query()):
+    return await _respond("artists", ids, _artist)
+
+
+@app.get("/v1/audio-features")
+async def get_audio_features(ids: str = Query()):
+    return await _respond("audio_features", ids, _audio_features)